@@ -0,0 +1,252 @@
+"""
+Offline analysis of recorded sessions.
+
+Processes the .rec files written by SessionRecorder (see record_path
+in the monitors) without GUI, with the decoding, filter and spectral
+code of the monitors (ChannelManager), in a pool of processes, one
+session at a time per process.
+
+Files named <start time>_<port>.rec with the same start time are
+recorded by one monitor and analyzed together as the players of one
+session, in the order of their port names.
+
+The recorded chunks are fed in the order of their timestamps and a
+frame is computed every --interval s of recorded time, like the
+worker of the monitors does. For each session, written to --output:
+
+<session>.npz:
+	t (frame times in s from the start), the relative power of
+	every band (theta, alpha, beta, game; (nchannels, nframes))
+	and ball_x, the ball_coordx trajectory.
+
+<session>.json:
+	Summary: duration, samples and sample rate of each source, mean
+	and std of the band powers of each channel, the goals (time and
+	winner) and the processing time.
+
+The game (libs.game.BallGame, seeded with --seed) runs from the
+start of the recording, after a goal the ball is put back to the
+center. With one player, the ball moves with the alpha power of the
+averaged normalized spectrum like in the single player monitor, with
+two by the difference of the alpha powers.
+
+summary.json lists the summaries of all sessions.
+"""
+from __future__ import print_function
+import argparse, glob, json, mmap, multiprocessing, os, sys, time
+import numpy as np
+
+from livedatafeed import LiveDataFeed
+from libs.channel import ChannelManager
+from libs.filters import StreamingFilter, signal_sos
+from libs.game import BallGame
+from libs.recorder import read_index
+from libs.spectrum import SpectralEngine, default_bands
+
+## settings of the monitors
+sample_rate = 10000
+resample_rate = 1000.
+nmax = 1000
+game_band = (4, 13)
+game_settings = {1: dict(tuning_factor=0.1, noise=0., damping=0.4),
+				2: dict(tuning_factor=5., noise=0.05, damping=0.3)}
+
+
+def find_sessions(paths):
+	""" Dict session name -> sorted list of its files, for the
+		given .rec files and directories.
+	"""
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files.extend(glob.glob(os.path.join(path, '*.rec')))
+		else:
+			files.append(path)
+	sessions = {}
+	for path in sorted(files):
+		name = os.path.basename(path)[:-len('.rec')] if path.endswith('.rec') else os.path.basename(path)
+		sessions.setdefault(name.split('_')[0], []).append(path)
+	return sessions
+
+
+def make_manager(nsources, channels_per_source=1, full_rate=False):
+	""" ChannelManager set up like in the monitors.
+	"""
+	nchannels = nsources*channels_per_source
+	rate = sample_rate if full_rate else resample_rate
+	feed = LiveDataFeed(nmax, filter=StreamingFilter(sos=signal_sos(rate)), shape=(nchannels,))
+	welch = SpectralEngine(rate, nmax, nmax*9//10, nseg=1,
+		bands=dict(default_bands, game=game_band), magnitude=True, shape=(nchannels,))
+	return ChannelManager(nsources, feed, welch, rate, full_rate, sample_rate, channels_per_source)
+
+
+def game_drive(manager, frame, fft_norm):
+	""" Drive of the ball for the frame, as in the monitors: the
+		alpha power of the running normalized spectrum fft_norm
+		(updated in place) with one player, the difference of the
+		alpha powers with two. None if there is none yet.
+	"""
+	if manager.nsources == 1:
+		if frame['spectrum'] is not None:
+			fft1 = manager.per_source(frame['spectrum'])[0].mean(axis=0)
+			fft1[0] = 0
+			fft_norm += fft1/np.sum(fft1)
+			fft_norm /= np.sum(fft_norm)
+		if not fft_norm.any():
+			return None
+		return np.sum(fft_norm[manager.welch.band_slices['game']])
+	if frame['powers'] is None:
+		return None
+	power, power2 = manager.per_source(frame['powers']['game']).mean(axis=1)[:2]
+	return power2 - power
+
+
+def merged_chunks(paths):
+	""" Generator of (timestamp, source, data) of the chunks of all
+		files of a session in the order of their timestamps.
+	"""
+	files, bufs, indices = [], [], []
+	try:
+		for path in paths:
+			f = open(path, 'rb')
+			files.append(f)
+			bufs.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+			indices.append(read_index(bufs[-1]))
+		timestamps = np.concatenate([index[0] for index in indices])
+		sources = np.concatenate([np.full(len(index[0]), i, dtype=int) for i, index in enumerate(indices)])
+		records = np.concatenate([np.arange(len(index[0])) for index in indices])
+		for k in np.argsort(timestamps, kind='mergesort'):
+			i, j = sources[k], records[k]
+			offset, length = indices[i][1][j], indices[i][2][j]
+			yield timestamps[k], i, bufs[i][offset:offset+length]
+	finally:
+		for buf in bufs:
+			buf.close()
+		for f in files:
+			f.close()
+
+
+def analyze_session(name, paths, output, interval=0.1, channels_per_source=1, full_rate=False, seed=0):
+	""" Analyze the session name recorded in paths, write its
+		results to the directory output and return its summary.
+	"""
+	tstart = time.time()
+	manager = make_manager(len(paths), channels_per_source, full_rate)
+	nplayers = min(len(paths), 2)
+	game = BallGame(nplayers, dt=interval, seed=seed, **game_settings[nplayers])
+	game.start()
+	fft_norm = np.zeros(manager.welch.nfreq)
+	t, ball_x, goals = [], [], []
+	powers = dict((band, []) for band in manager.welch.bands)
+
+	def step(timestamp):
+		""" Process the queued chunks and compute a frame, like
+			the worker does every interval.
+		"""
+		if manager.read() > 0:
+			manager.process()
+		frame = manager.frame()
+		if frame['time'] is not None and game.advance(frame['time'], game_drive(manager, frame, fft_norm)):
+			goals.append(dict(time=float(timestamp-t0), winner=int(game.winner)))
+			game.start()
+		if frame['powers'] is not None:
+			t.append(timestamp-t0)
+			for band, values in frame['powers'].items():
+				powers[band].append(values)
+			ball_x.append(float(game.x))
+
+	t0 = tframe = timestamp = None
+	for timestamp, i, data in merged_chunks(paths):
+		if t0 is None:
+			t0 = tframe = timestamp
+		manager.data_qs[i].put((data, timestamp))
+		if timestamp - tframe < interval:
+			continue
+		tframe = timestamp
+		step(timestamp)
+	## the chunks after the last full interval
+	if t0 is not None and timestamp > tframe:
+		tframe = timestamp
+		step(timestamp)
+
+	nchannels = manager.nchannels
+	arrays = dict(t=np.array(t), ball_x=np.array(ball_x))
+	for band, values in powers.items():
+		arrays[band] = np.reshape(values, (-1, nchannels)).T
+	np.savez_compressed(os.path.join(output, name + '.npz'), **arrays)
+
+	duration = float(tframe-t0) if t0 is not None else 0.
+	summary = dict(session=name, files=paths, duration=duration,
+		samples=manager.nsamples.tolist(),
+		sample_rate=(manager.nsamples/max(duration, 1e-9)/channels_per_source).tolist(),
+		bands=dict((band, dict(mean=arrays[band].mean(axis=-1).tolist() if len(t) else None,
+							std=arrays[band].std(axis=-1).tolist() if len(t) else None))
+					for band in powers),
+		goals=goals, nframes=len(t), processing_time=time.time()-tstart)
+	with open(os.path.join(output, name + '.json'), 'w') as f:
+		json.dump(summary, f, indent=1, sort_keys=True)
+	return summary
+
+
+def run_session(args):
+	""" analyze_session for the process pool, errors are returned
+		in the summary instead of stopping the pool.
+	"""
+	name, paths, output, options = args
+	try:
+		return analyze_session(name, paths, output, **options)
+	except (IOError, OSError, ValueError) as e:
+		return dict(session=name, files=paths, error=str(e))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Offline analysis of recorded EEG sessions')
+	parser.add_argument('paths', nargs='+',
+		help='.rec files or directories of them')
+	parser.add_argument('--output', '-o', default='analysis',
+		help='directory for the results')
+	parser.add_argument('--jobs', '-j', type=int, default=multiprocessing.cpu_count(),
+		help='number of processes')
+	parser.add_argument('--interval', type=float, default=0.1,
+		help='time between frames in s, like the frame interval of the monitors')
+	parser.add_argument('--channels', type=int, default=1,
+		help='electrodes per arduino')
+	parser.add_argument('--full-rate', action='store_true',
+		help='decode every sample instead of one average per chunk')
+	parser.add_argument('--seed', type=int, default=0,
+		help='seed of the random steps of the ball')
+	args = parser.parse_args()
+
+	sessions = find_sessions(args.paths)
+	if not sessions:
+		print('[analyze] no recordings found', file=sys.stderr)
+		sys.exit(1)
+	if not os.path.isdir(args.output):
+		os.makedirs(args.output)
+	options = dict(interval=args.interval, channels_per_source=args.channels, full_rate=args.full_rate,
+		seed=args.seed)
+	tasks = [(name, paths, args.output, options) for name, paths in sorted(sessions.items())]
+
+	tstart = time.time()
+	pool = multiprocessing.Pool(min(args.jobs, len(tasks)))
+	summaries = []
+	try:
+		for summary in pool.imap_unordered(run_session, tasks):
+			summaries.append(summary)
+			if 'error' in summary:
+				print('[analyze] %(session)s: %(error)s' % summary, file=sys.stderr)
+			else:
+				print('[analyze] %s: %.0f s, %d goals, %.1f s' % (summary['session'],
+					summary['duration'], len(summary['goals']), summary['processing_time']), file=sys.stderr)
+	finally:
+		pool.close()
+		pool.join()
+
+	summaries.sort(key=lambda summary: summary['session'])
+	with open(os.path.join(args.output, 'summary.json'), 'w') as f:
+		json.dump(summaries, f, indent=1, sort_keys=True)
+	print('[analyze] %d sessions in %.1f s' % (len(summaries), time.time()-tstart), file=sys.stderr)
+
+
+if __name__ == "__main__":
+	main()
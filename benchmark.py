@@ -0,0 +1,415 @@
+"""
+Headless benchmark of the acquisition to ball movement pipeline.
+
+Runs the processing chain of the monitors without GUI on synthetic
+EEG (see libs.synthetic) for every combination of sample rate,
+window size (nmax) and number of sources (headsets) given, each
+with --per-source channels, and measures:
+
+decode:
+	Throughput of decode_output and StreamDecoder in MB/s.
+
+feed:
+	Cost of LiveDataFeed append/extend per chunk and of
+	read_arrays/read_filtered.
+
+chain:
+	Time per update of the interp1d, lfilter and rfft chain the
+	monitors used to run on every timer tick for each channel,
+	compared to the streaming chain (ChannelManager.process:
+	read_filtered, SpectralEngine, the FilterBank envelopes and
+	the decimation pyramid for all channels at once) processing
+	the same chunk. With a single channel, the streaming chain is
+	slower per update than the legacy one, it does more work per
+	chunk. Both break even at two channels, the streaming chain
+	is cheaper with more channels and larger windows.
+
+render:
+	Time to get the signal window of a frame for plotting and the
+	number of points handed to the plot, every sample compared to
+	the min/max decimation to --width pixels (2 points each).
+
+bandpower:
+	Response of the relative alpha power to an alpha rhythm
+	switched on in noise, of the Welch spectrum (rfft of the
+	window, fft), of RecursiveSpectrum (recursive, time constant
+	--tau) and of the FilterBank envelopes (envelope): the delay
+	in ms from the onset until the power crosses the middle
+	between its levels before and after (latency_*), and the time
+	per chunk of the update and band_powers (cpu_*, mean over all
+	chunks, the Welch spectrum only computes one every hop).
+
+latency:
+	Time from the arrival of a chunk of bytes in the queue to the
+	end of ProcessingWorker.step, which reads and processes it,
+	computes the frame and moves the ball (BallGame, with the
+	drive of analyze_sessions), with a frame for every chunk. The
+	worker adds up to its frame interval on top of this.
+
+Results are written as JSON. With --baseline, the results are
+compared to those of an earlier run and the exit status tells
+whether the decode throughput or the median and 95th percentile
+of the latency got worse by more than --tolerance.
+"""
+from __future__ import print_function
+import argparse, itertools, json, platform, sys, time
+import numpy as np
+from scipy.interpolate import interp1d
+from scipy.signal import butter, lfilter
+
+from analyze_sessions import game_drive, game_settings
+from livedatafeed import LiveDataFeed
+from libs.channel import ChannelManager
+from libs.decode import decode_output, encode_output, StreamDecoder
+from libs.filters import StreamingFilter, FilterBank, signal_sos, eeg_bands
+from libs.game import BallGame
+from libs.spectrum import SpectralEngine, RecursiveSpectrum, default_bands
+from libs.synthetic import SyntheticEEG
+
+## measurements compared to the baseline, the tails (p99, max) of
+## the latency depend on the scheduler and are only reported
+gated = dict(decode=None, latency=('p50', 'p95'))
+
+## settings of the monitors
+resample_rate = 1000.
+game_band = (4, 13)
+## filter of the legacy chain, the monitors used [0.0, 0.34], which
+## newer scipy rejects
+b, a = butter(3, [1e-3, 0.34], btype='band')
+
+
+def measure(func, repeat=20):
+	""" Median time of func() in s.
+	"""
+	times = []
+	for i in range(repeat):
+		tstart = time.time()
+		func()
+		times.append(time.time() - tstart)
+	return float(np.median(times))
+
+
+def percentiles(times):
+	""" Summary of a list of times in ms.
+	"""
+	times = 1e3*np.asarray(times)
+	return dict(p50=float(np.percentile(times, 50)), p95=float(np.percentile(times, 95)),
+				p99=float(np.percentile(times, 99)), max=float(np.max(times)))
+
+
+def make_manager(rate, nmax, nsources, full_rate, per_source=1):
+	""" ChannelManager set up like in the monitors.
+	"""
+	nchannels = nsources*per_source
+	grid_rate = rate if full_rate else resample_rate
+	feed = LiveDataFeed(nmax, filter=StreamingFilter(sos=signal_sos(grid_rate)), shape=(nchannels,))
+	welch = SpectralEngine(grid_rate, nmax, nmax*9//10, nseg=1,
+		bands=dict(default_bands, game=game_band), magnitude=True, shape=(nchannels,))
+	bank = FilterBank(grid_rate, dict(eeg_bands, game=game_band), shape=(nchannels,))
+	return ChannelManager(nsources, feed, welch, grid_rate, full_rate, rate, per_source, bank=bank)
+
+
+def make_chunks(rate, nsources, chunk_time, duration, per_source=1, seed=0):
+	""" Raw chunks of chunk_time s per source, as read from the
+		serial port with the timeout of ComMonitorThread.
+	"""
+	source = SyntheticEEG(rate, nsources*per_source, seed=seed)
+	nchunk = max(int(rate*chunk_time), 1)
+	samples = source.generate(nchunk*max(int(duration/chunk_time), 1))
+	chunks = []
+	for c in range(nsources):
+		channels = samples[c*per_source:(c+1)*per_source]
+		chunks.append([encode_output(channels[:, i:i+nchunk].T.ravel())
+						for i in range(0, samples.shape[1], nchunk)])
+	return chunks
+
+
+def bench_decode(rate, nsources, duration, per_source=1):
+	""" Decoding throughput in MB/s, in one go and demultiplexed
+		in chunks.
+	"""
+	source = SyntheticEEG(rate, per_source, seed=0)
+	data = b'\x05' + source.frames(int(rate*duration*nsources))
+	mb = len(data)/2.**20
+	decoder = StreamDecoder(per_source)
+	def stream():
+		decoder.reset()
+		for i in range(0, len(data), 4096):
+			decoder.decode_channels(data[i:i+4096])
+	return dict(decode_output=mb/measure(lambda: decode_output(data), 5),
+				stream_decoder=mb/measure(stream, 5))
+
+
+def bench_feed(rate, nmax, nchannels, chunk_time, full_rate):
+	""" Cost in us of adding the grid samples of one chunk of
+		all channels to a LiveDataFeed and of reading it.
+	"""
+	grid_rate = rate if full_rate else resample_rate
+	feed = LiveDataFeed(nmax, filter=StreamingFilter(sos=signal_sos(grid_rate)), shape=(nchannels,))
+	n = max(int(grid_rate*chunk_time), 1)
+	t = np.arange(n)/float(grid_rate)
+	y = np.random.standard_normal((nchannels, n))
+	state = dict(t0=0.)
+	def append():
+		state['t0'] += n/float(grid_rate)
+		feed.extend_data(dict(timestamp=state['t0']+t, temperature=y))
+	## fill the window first
+	for i in range(nmax):
+		append()
+	feed.read_filtered()
+	def append_read():
+		append()
+		feed.read_filtered()
+	results = dict(append=measure(append, 200), read_arrays=measure(feed.read_arrays, 200))
+	results['read_filtered'] = measure(append_read, 200) - results['append']
+	return dict((key, 1e6*value) for key, value in results.items())
+
+
+def legacy_update(samples, nmax):
+	""" The processing of update_monitor before the streaming
+		chain: interpolation, filter and fft of the whole window.
+	"""
+	xdata = [s[0] for s in samples]
+	ydata = [s[1] for s in samples]
+	n = len(ydata)
+	f = interp1d(xdata, ydata)
+	xdata = np.linspace(xdata[0], xdata[-1], n)
+	ydata = lfilter(b, a, f(xdata))
+	delta = xdata[1]-xdata[0]
+	fft1 = np.abs(np.fft.rfft(ydata))
+	x = np.fft.rfftfreq(n, d=delta)
+	fft1_norm = fft1[1:]/np.sum(fft1[1:])
+	ind = (x[1:]>game_band[0])*(x[1:]<game_band[1])
+	return np.sum(fft1_norm[ind])
+
+
+def bench_chain(rate, nmax, nsources, chunk_time, full_rate, per_source=1):
+	""" Time per update in ms of the legacy chain (one window of
+		nmax samples per channel) and of the streaming chain given
+		the grid samples of one chunk.
+	"""
+	nchannels = nsources*per_source
+	t = np.arange(nmax)*chunk_time
+	samples = list(zip(t, np.random.standard_normal(nmax)))
+	legacy = measure(lambda: [legacy_update(samples, nmax) for c in range(nchannels)])
+
+	manager = make_manager(rate, nmax, nsources, full_rate, per_source)
+	feed, welch = manager.feed, manager.welch
+	nnew = max(int(welch.fs*chunk_time), 1)
+	t = np.arange(nmax)/welch.fs
+	state = dict(t0=t[-1])
+	tnew = np.arange(1, nnew+1)/welch.fs
+	ynew = np.random.standard_normal((nchannels, nnew))
+	feed.extend_data(dict(timestamp=t, temperature=np.random.standard_normal((nchannels, nmax))))
+	manager.process()
+	def streaming():
+		feed.extend_data(dict(timestamp=state['t0']+tnew, temperature=ynew))
+		state['t0'] += nnew/welch.fs
+		manager.process()
+		welch.band_powers()
+	return dict(legacy=1e3*legacy, streaming=1e3*measure(streaming, 200))
+
+
+def bench_render(rate, nmax, nsources, full_rate, per_source=1, width=1000):
+	""" Time in ms to get the window of all channels for
+		plotting and points per channel, with and without
+		decimation to width pixels.
+	"""
+	manager = make_manager(rate, nmax, nsources, full_rate, per_source)
+	nchannels, fs = manager.nchannels, manager.welch.fs
+	for i in range(4):
+		t = (i*nmax + np.arange(nmax))/fs
+		manager.feed.extend_data(dict(timestamp=t, temperature=np.random.standard_normal((nchannels, nmax))))
+		manager.process()
+	full = measure(manager.frame, 200)
+	points_full = len(manager.frame()['x'])
+	manager.render_points = 2*width
+	decimated = measure(manager.frame, 200)
+	points_decimated = len(manager.frame()['x'])
+	return dict(full=1e3*full, decimated=1e3*decimated,
+		points_full=points_full, points_decimated=points_decimated)
+
+
+def bench_bandpower(rate, nmax, nchannels, chunk_time, full_rate, tau=0.1, duration=6., onset=4.):
+	""" Latency in ms of the relative alpha power to the onset of
+		an alpha rhythm and time per chunk in ms, of the Welch
+		spectrum, RecursiveSpectrum and FilterBank on the same
+		signal in chunks of chunk_time s.
+	"""
+	fs = rate if full_rate else resample_rate
+	nnew = max(int(fs*chunk_time), 1)
+	t = np.arange(int(duration*fs))/fs
+	rng = np.random.RandomState(0)
+	y = rng.standard_normal((nchannels, len(t))) + 2*np.sin(2*np.pi*10.*t)*(t >= onset)
+	bands = dict(default_bands, game=game_band)
+	welch = SpectralEngine(fs, nmax, nmax*9//10, nseg=1, bands=bands, magnitude=True, shape=(nchannels,))
+	recursive = RecursiveSpectrum(fs, nmax, tau, bands=bands, magnitude=True, shape=(nchannels,), fmax=170.)
+	bank = FilterBank(fs, dict(eeg_bands, game=game_band), tau=tau, shape=(nchannels,))
+	## (update with new samples, alpha power or None if there is none yet)
+	estimators = dict(
+		fft=(welch.update, lambda: welch.band_powers()['alpha'] if len(welch.segments) else None),
+		recursive=(recursive.update, lambda: recursive.band_powers()['alpha']),
+		envelope=(bank, lambda: bank.band_powers()['alpha']))
+	results = {}
+	for name, (update, alpha_power) in estimators.items():
+		powers, cpu = [], []
+		for i in range(0, len(t), nnew):
+			tstart = time.time()
+			update(y[:, i:i+nnew])
+			alpha = alpha_power()
+			cpu.append(time.time() - tstart)
+			powers.append(np.mean(alpha) if alpha is not None else np.nan)
+		tblock = t[np.minimum(np.arange(nnew, len(t)+nnew, nnew), len(t))-1]
+		powers = np.array(powers)
+		before = np.nanmean(powers[(tblock >= onset-1.) & (tblock < onset)])
+		after = np.nanmean(powers[tblock >= duration-1.])
+		crossed = np.nonzero((tblock >= onset) & (powers >= (before+after)/2))[0]
+		results['latency_' + name] = 1e3*(tblock[crossed[0]]-onset) if len(crossed) else np.inf
+		results['cpu_' + name] = 1e3*float(np.mean(cpu))
+	return results
+
+
+def game_worker(manager, game):
+	""" ProcessingWorker moving the ball like the monitors, with
+		the drive of analyze_sessions.
+	"""
+	## the worker is a QThread, the other measurements run without PyQt4
+	from libs.worker import ProcessingWorker
+
+	class GameWorker(ProcessingWorker):
+		def __init__(self):
+			ProcessingWorker.__init__(self, manager, 0., game=game)
+			self.fft_norm = np.zeros(manager.spectral.nfreq)
+
+		def update_game(self, frame):
+			self.advance_game(frame, game_drive(self.manager, frame, self.fft_norm))
+
+	return GameWorker()
+
+
+def bench_latency(rate, nmax, nsources, chunk_time, duration, full_rate, per_source=1):
+	""" Latency in ms from a chunk entering the queues of all
+		sources to the end of the worker step moving the ball.
+	"""
+	chunks = make_chunks(rate, nsources, chunk_time, duration, per_source)
+	manager = make_manager(rate, nmax, nsources, full_rate, per_source)
+	nplayers = min(nsources, 2)
+	game = BallGame(nplayers, dt=chunk_time, seed=0, **game_settings[nplayers])
+	game.start()
+	## a frame for every chunk
+	worker = game_worker(manager, game)
+	latencies = []
+	tstart = time.time()
+	for i in range(len(chunks[0])):
+		tarrival = time.time()
+		for c, data_q in enumerate(manager.data_qs):
+			data_q.put((chunks[c][i], tstart + (i+1)*chunk_time))
+		worker.step()
+		latencies.append(time.time() - tarrival)
+	results = percentiles(latencies)
+	results['chunk_period'] = 1e3*chunk_time
+	return results
+
+
+def run(rates, windows, nsources_list, chunk_time=0.01, duration=2., full_rate=False,
+		per_source=1, width=1000, tau=0.1, verbose=True):
+	results = []
+	for rate, nmax, nsources in itertools.product(rates, windows, nsources_list):
+		config = dict(rate=rate, nmax=nmax, sources=nsources, per_source=per_source,
+					full_rate=full_rate, chunk_time=chunk_time)
+		result = dict(config=config,
+			decode=bench_decode(rate, nsources, duration, per_source),
+			feed=bench_feed(rate, nmax, nsources*per_source, chunk_time, full_rate),
+			chain=bench_chain(rate, nmax, nsources, chunk_time, full_rate, per_source),
+			render=bench_render(rate, nmax, nsources, full_rate, per_source, width),
+			bandpower=bench_bandpower(rate, nmax, nsources*per_source, chunk_time, full_rate, tau),
+			latency=bench_latency(rate, nmax, nsources, chunk_time, duration, full_rate, per_source))
+		results.append(result)
+		if verbose:
+			print('[benchmark] %(rate)d Hz, nmax %(nmax)d, %(sources)d x %(per_source)d channels:' % config,
+				'decode %.0f MB/s,' % result['decode']['decode_output'],
+				'read_filtered %.0f us,' % result['feed']['read_filtered'],
+				'chain %.2f -> %.2f ms,' % (result['chain']['legacy'], result['chain']['streaming']),
+				'render %(points_full)d -> %(points_decimated)d points,' % result['render'],
+				'alpha latency %(latency_fft).0f -> %(latency_recursive).0f ms' % result['bandpower'],
+				'(%(cpu_fft).3f -> %(cpu_recursive).3f ms),' % result['bandpower'],
+				'latency p95 %.2f ms' % result['latency']['p95'], file=sys.stderr)
+	return results
+
+
+def compare(results, baseline, tolerance=1.5):
+	""" Returns a list of the gated measurements in results which
+		are worse than in baseline (results of an earlier run) by
+		more than a factor tolerance. Throughputs (decode) should
+		not drop, times should not grow.
+	"""
+	regressions = []
+	previous = dict((json.dumps(result['config'], sort_keys=True), result) for result in baseline)
+	for result in results:
+		old = previous.get(json.dumps(result['config'], sort_keys=True))
+		if old is None:
+			continue
+		for group, keys in gated.items():
+			values = result[group]
+			for key in keys or values.keys():
+				value = values[key]
+				ratio = value/old[group][key] if old[group].get(key) else 1.
+				if group == 'decode':
+					ratio = 1./ratio
+				if ratio > tolerance:
+					regressions.append(dict(config=result['config'], measure='%s.%s' % (group, key),
+						baseline=old[group][key], value=value))
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Headless benchmark of the EEG processing pipeline')
+	parser.add_argument('--rates', type=int, nargs='+', default=[10000],
+		help='sample rates in Hz')
+	parser.add_argument('--nmax', type=int, nargs='+', default=[1000],
+		help='window sizes in samples')
+	parser.add_argument('--sources', type=int, nargs='+', default=[1, 2],
+		help='numbers of sources (headsets)')
+	parser.add_argument('--per-source', type=int, default=1,
+		help='channels of each source')
+	parser.add_argument('--chunk-time', type=float, default=0.01,
+		help='duration of a serial chunk in s')
+	parser.add_argument('--duration', type=float, default=2.,
+		help='amount of data per latency run in s')
+	parser.add_argument('--full-rate', action='store_true',
+		help='decode every sample instead of one average per chunk')
+	parser.add_argument('--width', type=int, default=1000,
+		help='plot width in pixels for the render measurement')
+	parser.add_argument('--tau', type=float, default=0.1,
+		help='time constant in s of the recursive band powers')
+	parser.add_argument('--output', '-o',
+		help='JSON file for the results, default stdout')
+	parser.add_argument('--baseline',
+		help='JSON file of an earlier run, exit with an error if a measurement got worse')
+	parser.add_argument('--tolerance', type=float, default=1.5,
+		help='factor by which a measurement may be worse than the baseline')
+	args = parser.parse_args()
+
+	report = dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+		python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+		results=run(args.rates, args.nmax, args.sources, args.chunk_time,
+					args.duration, args.full_rate, args.per_source, args.width, args.tau))
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+	else:
+		json.dump(report, sys.stdout, indent=1, sort_keys=True)
+		print()
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			regressions = compare(report['results'], json.load(f)['results'], args.tolerance)
+		for regression in regressions:
+			print('[benchmark] regression %(measure)s: %(value).3g, was %(baseline).3g' % regression,
+				regression['config'], file=sys.stderr)
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
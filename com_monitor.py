@@ -4,6 +4,8 @@ import time
 
 import serial
 
+from libs.clock import monotonic
+
 
 class ComMonitorThread(threading.Thread):
     """ A thread for monitoring a COM port. The COM port is 
@@ -13,8 +15,9 @@ class ComMonitorThread(threading.Thread):
             Queue for received data. Items in the queue are
             (data, timestamp) pairs, where data is a binary 
             string representing the received data, and timestamp
-            is the time elapsed from the thread's start (in 
-            seconds).
+            is the time of its arrival (in seconds) on the
+            monotonic clock of libs.clock, which is shared by
+            all threads.
         
         error_q:
             Queue for error messages. In particular, if the 
@@ -33,6 +36,21 @@ class ComMonitorThread(threading.Thread):
             value is low, the thread will return data in finer
             grained chunks, with more accurate timestamps, but
             it will also consume more CPU.
+        
+        sample_rate:
+            The sample rate (in Hz) the device is configured to.
+        
+        nchannels:
+            The number of channels the device is configured to,
+            their samples are interleaved in the data.
+        
+        data_ready:
+            Optional threading.Event, set whenever data was put
+            into data_q, so consumers can sleep until data arrives.
+        
+        recorder:
+            Optional SessionRecorder (not started yet), saving all
+            received chunks to a file while the port is open.
     """
     def __init__(   self, 
                     data_q, error_q, 
@@ -40,7 +58,11 @@ class ComMonitorThread(threading.Thread):
                     port_baud,
                     port_stopbits=serial.STOPBITS_ONE,
                     port_parity=serial.PARITY_NONE,
-                    port_timeout=0.01):#None):
+                    port_timeout=0.01,#None):
+                    sample_rate=10000,
+                    nchannels=1,
+                    data_ready=None,
+                    recorder=None):
         threading.Thread.__init__(self)
         
         self.serial_port = None
@@ -49,6 +71,10 @@ class ComMonitorThread(threading.Thread):
                                 stopbits=port_stopbits,
                                 parity=port_parity,
                                 timeout=port_timeout)
+        self.sample_rate = sample_rate
+        self.nchannels = nchannels
+        self.data_ready = data_ready
+        self.recorder = recorder
 
         self.data_q = data_q
         self.error_q = error_q
@@ -64,14 +90,13 @@ class ComMonitorThread(threading.Thread):
             
             #self.serial_port.readline()
             time.sleep(0.2)
-            self.serial_port.write('conf s:10000;c:1;\n')
+            self.serial_port.write('conf s:%d;c:%d;\n' % (self.sample_rate, self.nchannels))
         except serial.SerialException, e:
             self.error_q.put(e.message)
             return
         
-        
-        # Restart the clock
-        time.clock()
+        if self.recorder is not None:
+            self.recorder.start()
         
         while self.alive.isSet():
             # Reading 1 byte, followed by whatever is left in the
@@ -82,12 +107,18 @@ class ComMonitorThread(threading.Thread):
             data += self.serial_port.read(self.serial_port.inWaiting())
 
             if len(data) > 0:
-                timestamp = time.clock()
+                timestamp = monotonic()
                 self.data_q.put((data, timestamp))
+                if self.data_ready is not None:
+                    self.data_ready.set()
+                if self.recorder is not None:
+                    self.recorder.write(data, timestamp)
             
         # clean up
         if self.serial_port:
             self.serial_port.close()
+        if self.recorder is not None:
+            self.recorder.join()
 
     def join(self, timeout=None):
         self.alive.clear()
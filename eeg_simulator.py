@@ -0,0 +1,200 @@
+"""
+A virtual arduino for testing the monitors without hardware.
+
+Opens a pseudo terminal and streams synthetic EEG (pink noise
+plus alpha bursts, see libs.synthetic) in the 2 byte frame format
+of the firmware. The name of the terminal is printed on start,
+pass it to the monitor with --port. Like the firmware, the
+simulator reconfigures on 'conf s:<rate>;c:<channels>;'.
+
+The output is limited to the byte rate of the given baud rate
+(10 bits per byte), samples which do not fit are dropped like
+on a saturated serial line, as are samples the reader does not
+take up in time. Throughput and drops are printed every second.
+
+Typing a number (or one per channel) on stdin sets the amplitude
+of the alpha bursts.
+"""
+from __future__ import print_function
+import argparse, errno, fcntl, os, re, select, sys, time, tty
+
+from libs.synthetic import SyntheticEEG
+
+conf_pattern = re.compile(br'conf s:(\d+);c:(\d+);')
+max_command = 64
+
+
+class Simulator(object):
+	""" Serves synthetic EEG on the master side of a pty.
+
+		rate/nchannels:
+			Initial configuration, until a conf command arrives.
+
+		baud:
+			Line speed to emulate, 0 for no limit.
+
+		max_pending:
+			Output the reader has not taken up (in s) before
+			samples are dropped.
+	"""
+	def __init__(self, rate=10000, nchannels=1, baud=230400, interval=0.005,
+				max_pending=0.5, **kwargs):
+		self.baud = baud
+		self.interval = interval
+		self.max_pending = max_pending
+		self.kwargs = kwargs
+		self.master, self.slave = os.openpty()
+		tty.setraw(self.slave)
+		fcntl.fcntl(self.master, fcntl.F_SETFL, fcntl.fcntl(self.master, fcntl.F_GETFL) | os.O_NONBLOCK)
+		self.name = os.ttyname(self.slave)
+		## received bytes not part of a complete command yet
+		self.commands = b''
+		self.configure(rate, nchannels)
+
+	def configure(self, rate, nchannels):
+		self.source = SyntheticEEG(rate, nchannels, **self.kwargs)
+		self.frame_size = 2*nchannels
+		self.pending = b''
+		self.tstart = time.time()
+		self.nsent = 0
+		self.nline = 0
+		self.reset_stats()
+		bytes_per_second = rate*self.frame_size
+		if self.baud and 10*bytes_per_second > self.baud:
+			print('[simulator] %d Hz x %d channels needs %d baud, more than %d' % (
+				rate, nchannels, 10*bytes_per_second, self.baud))
+
+	def reset_stats(self):
+		self.tstats = time.time()
+		self.nwritten = 0
+		self.ndropped = 0
+
+	def read_commands(self):
+		try:
+			data = os.read(self.master, 1024)
+		except OSError as e:
+			## no reader connected to the slave side
+			if e.errno == errno.EIO:
+				return
+			raise
+		self.handle_commands(data)
+
+	def handle_commands(self, data):
+		""" Apply the conf commands completed by data, a command
+			may be split over several reads.
+		"""
+		self.commands += data
+		end = 0
+		for match in conf_pattern.finditer(self.commands):
+			rate, nchannels = match.groups()
+			print('[simulator] conf %s Hz, %s channels' % (rate.decode(), nchannels.decode()))
+			self.configure(int(rate), int(nchannels))
+			end = match.end()
+		## only the start of a command can be completed later
+		self.commands = self.commands[end:][-max_command:]
+
+	def set_alpha(self, line):
+		try:
+			alpha = [float(value) for value in line.split()]
+		except ValueError:
+			print('[simulator] alpha amplitude expected, got %r' % line)
+			return
+		if len(alpha):
+			self.kwargs['alpha'] = self.source.alpha = alpha[0] if len(alpha) == 1 else alpha
+			print('[simulator] alpha %s' % alpha)
+
+	def generate(self):
+		""" Append the samples due since the start to pending.
+		"""
+		elapsed = time.time() - self.tstart
+		n = int(elapsed*self.source.fs) - self.nsent
+		if n <= 0:
+			return
+		self.nsent += n
+		if self.baud:
+			## samples beyond the line capacity are lost
+			capacity = int(elapsed*self.baud/10./self.frame_size) - self.nline
+			keep = max(0, min(n, capacity))
+			self.ndropped += n - keep
+			n = keep
+		self.nline += n
+		if n > 0:
+			self.pending += self.source.frames(n)
+
+		## drop the oldest whole samples the reader did not take up
+		limit = int(self.max_pending*self.source.fs)*self.frame_size
+		if len(self.pending) > limit:
+			ndrop = (len(self.pending) - limit)//self.frame_size
+			self.pending = self.pending[ndrop*self.frame_size:]
+			self.ndropped += ndrop
+
+	def write(self):
+		try:
+			n = os.write(self.master, self.pending)
+		except OSError as e:
+			if e.errno in (errno.EAGAIN, errno.EIO):
+				return
+			raise
+		self.pending = self.pending[n:]
+		self.nwritten += n
+
+	def report(self):
+		elapsed = time.time() - self.tstats
+		if elapsed < 1.:
+			return
+		print('[simulator] %.0f samples/s written, %.0f dropped, %d bytes pending' % (
+			self.nwritten/self.frame_size/elapsed, self.ndropped/elapsed, len(self.pending)))
+		self.reset_stats()
+
+	def run(self):
+		print('[simulator] serving on %s' % self.name)
+		sys.stdout.flush()
+		while True:
+			wlist = [self.master] if self.pending else []
+			readable, writable, _ = select.select([self.master, sys.stdin], wlist, [], self.interval)
+			if self.master in readable:
+				self.read_commands()
+			if sys.stdin in readable:
+				line = sys.stdin.readline()
+				if not line:
+					break
+				self.set_alpha(line)
+			self.generate()
+			if writable:
+				self.write()
+			self.report()
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Virtual EEG arduino on a pseudo terminal')
+	parser.add_argument('--rate', type=int, default=10000,
+		help='sample rate in Hz until a conf command arrives')
+	parser.add_argument('--channels', type=int, default=1,
+		help='number of channels until a conf command arrives')
+	parser.add_argument('--baud', type=int, default=230400,
+		help='emulated line speed, 0 for no limit')
+	parser.add_argument('--noise', type=float, default=10.,
+		help='std of the pink noise in ADC units')
+	parser.add_argument('--alpha', type=float, default=20.,
+		help='amplitude of the alpha bursts in ADC units')
+	parser.add_argument('--offset', type=int, default=512,
+		help='zero line of the signal in ADC units')
+	parser.add_argument('--burst-rate', type=float, default=0.5,
+		help='mean number of alpha bursts per second')
+	parser.add_argument('--burst-length', type=float, default=1.,
+		help='duration of an alpha burst in s')
+	parser.add_argument('--seed', type=int,
+		help='seed of the random generator')
+	args = parser.parse_args()
+
+	simulator = Simulator(args.rate, args.channels, baud=args.baud,
+		noise=args.noise, alpha=args.alpha, offset=args.offset, burst_rate=args.burst_rate,
+		burst_length=args.burst_length, seed=args.seed)
+	try:
+		simulator.run()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,168 @@
+from __future__ import print_function
+import threading, wave
+import numpy as np
+import pyaudio
+
+
+def load_wav(path, rate, channels):
+	""" Returns the samples of a WAV file as float32 array (n,
+		channels) in [-1, 1], converted to the given rate (linear
+		interpolation) and number of channels.
+	"""
+	f = wave.open(path, 'rb')
+	try:
+		width, nch, fs = f.getsampwidth(), f.getnchannels(), f.getframerate()
+		data = f.readframes(f.getnframes())
+	finally:
+		f.close()
+
+	if width == 1:
+		samples = (np.frombuffer(data, np.uint8).astype(np.float32) - 128)/128.
+	elif width == 3:
+		raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+		samples = ((raw[:,0] << 8 | raw[:,1] << 16 | raw[:,2] << 24) >> 8)/float(2**23)
+	else:
+		dtype = {2: '<i2', 4: '<i4'}[width]
+		samples = np.frombuffer(data, dtype)/float(2**(8*width-1))
+	samples = samples.astype(np.float32).reshape(-1, nch)
+
+	if nch != channels:
+		## mixdown to mono, then copied to every output channel
+		samples = np.repeat(samples.mean(axis=1, keepdims=True), channels, axis=1)
+	if fs != rate and len(samples) > 1:
+		n = int(round(len(samples)*float(rate)/fs))
+		t = np.arange(n)*float(fs)/rate
+		samples = np.column_stack([np.interp(t, np.arange(len(samples)), samples[:,i])
+			for i in range(channels)]).astype(np.float32)
+	return samples
+
+
+class Voice(object):
+	""" A sound being played: its samples, the next position,
+		volume, looping and the remaining fade out gains (None if
+		not fading). Voices compare by identity.
+	"""
+	def __init__(self, samples, volume=1., loop=False):
+		self.samples = samples
+		self.pos = 0
+		self.volume = volume
+		self.loop = loop
+		self.fade = None
+
+
+class AudioEngine(object):
+	""" Plays preloaded sounds without blocking the caller.
+
+		One PyAudio instance and one output stream stay open, the
+		stream pulls its buffers from a callback running in the
+		PortAudio thread, which mixes all playing sounds (voices),
+		so e.g. the ambience keeps running under a goal jingle.
+
+		load() decodes a WAV file once and caches it under a name,
+		play() starts a voice of a cached sound and returns at once.
+		If no audio device can be opened, the engine stays silent.
+	"""
+	def __init__(self, rate=44100, channels=2, chunk=1024, verbose=True):
+		self.rate = rate
+		self.channels = channels
+		self.chunk = chunk
+		self.verbose = verbose
+		self.sounds = {}
+		self.voices = []
+		self.lock = threading.Lock()
+		self.pa = pyaudio.PyAudio()
+		try:
+			self.stream = self.pa.open(format=pyaudio.paFloat32, channels=channels,
+				rate=rate, output=True, frames_per_buffer=chunk,
+				stream_callback=self.callback)
+		except (IOError, OSError) as e:
+			self.log('no audio output: %s' % e)
+			self.stream = None
+
+	def log(self, msg):
+		if self.verbose:
+			print('[audio] ' + msg)
+
+	def load(self, name, path):
+		""" Decode and cache the sound in path, returns False if
+			it cannot be read.
+		"""
+		try:
+			self.sounds[name] = load_wav(path, self.rate, self.channels)
+		except (IOError, OSError, EOFError, wave.Error, KeyError) as e:
+			self.log('cannot load %s: %s' % (path, e))
+			return False
+		return True
+
+	def play(self, name, volume=1., loop=False):
+		""" Start playing the cached sound name, returns the voice
+			(for stop) or None if the sound is not loaded.
+		"""
+		if name not in self.sounds or self.stream is None:
+			return None
+		voice = Voice(self.sounds[name], volume, loop)
+		with self.lock:
+			self.voices.append(voice)
+		return voice
+
+	def stop(self, voice, fade=0.):
+		""" Stop voice (as returned by play, None is ignored),
+			fading out over fade seconds.
+		"""
+		if voice is None:
+			return
+		with self.lock:
+			voice.fade = np.linspace(1., 0., max(1, int(fade*self.rate)), dtype=np.float32)
+			voice.loop = False
+
+	def stop_all(self, fade=0.):
+		for voice in list(self.voices):
+			self.stop(voice, fade)
+
+	def playing(self, voice):
+		return voice is not None and any(v is voice for v in self.voices)
+
+	def callback(self, in_data, frame_count, time_info, status):
+		out = np.zeros((frame_count, self.channels), np.float32)
+		with self.lock:
+			## finished voices are dropped
+			self.voices = [voice for voice in self.voices if not self.mix(voice, out)]
+		np.clip(out, -1., 1., out=out)
+		return out.tobytes(), pyaudio.paContinue
+
+	def mix(self, voice, out):
+		""" Add the next len(out) samples of voice to out, returns
+			True when the voice has finished.
+		"""
+		samples, n = voice.samples, len(out)
+		buf = np.zeros_like(out)
+		pos, filled = voice.pos, 0
+		while filled < n and len(samples):
+			m = min(n - filled, len(samples) - pos)
+			buf[filled:filled+m] = samples[pos:pos+m]
+			filled += m
+			pos += m
+			if pos == len(samples):
+				if not voice.loop:
+					break
+				pos = 0
+		voice.pos = pos
+
+		buf *= voice.volume
+		fade = voice.fade
+		if fade is not None:
+			m = min(n, len(fade))
+			buf[:m] *= fade[:m, None]
+			buf[m:] = 0
+			voice.fade = fade[m:]
+		out += buf
+		if fade is not None and len(voice.fade) == 0:
+			return True
+		return pos == len(samples) and not voice.loop
+
+	def close(self):
+		if self.stream is not None:
+			self.stream.stop_stream()
+			self.stream.close()
+			self.stream = None
+		self.pa.terminate()
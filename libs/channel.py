@@ -0,0 +1,285 @@
+import Queue
+import numpy as np
+
+from libs.utils import get_all_from_queue, get_item_from_queue, StageTimes
+from libs.decode import StreamDecoder
+from libs.resample import StreamingResampler
+from libs.clock import SampleClock
+from libs.decimate import MinMaxPyramid
+
+
+class ChannelManager(object):
+	""" Acquisition and signal processing of the EEG channels of
+		nsources sources (ComMonitorThreads or ReplayThreads), each
+		sending channels_per_source interleaved channels.
+
+		The samples of each source are decoded, demultiplexed,
+		timestamped by a SampleClock of the source (modelling its
+		rate from the chunk arrivals) and resampled onto a uniform
+		grid of rate resample_rate, all sources share the grid. The
+		grid samples available for every source are stacked into one (nchannels, n) array,
+		the channels of the first source first, so the bandpass
+		filter (feed, a LiveDataFeed with shape (nchannels,)) and
+		the Welch spectrum (welch, a SpectralEngine with shape
+		(nchannels,)) process all channels at once.
+
+		full_rate:
+			Keep every sample, otherwise the samples of every chunk
+			are reduced to their mean value per channel, timestamped
+			at the middle of the chunk.
+
+		sample_rate:
+			Nominal sample rate (per channel) of the sources.
+
+		max_lag:
+			A source lagging more than max_lag seconds behind the
+			others (e.g. a port which failed to open) is padded
+			with its last values, so the others are not held up.
+
+		stats:
+			Optional StageTimes recording the 'decode', 'resample',
+			'spectrum', 'bands', 'estimator' and 'decimate' stages.
+
+		bank:
+			Optional FilterBank (shape (nchannels,)) run on the
+			filtered signal, its band power envelopes are added to
+			every frame without waiting for a spectrum.
+
+		estimator:
+			Optional RecursiveSpectrum (shape (nchannels,)) updated
+			with every filtered sample. If set, freqs, spectrum and
+			powers of every frame come from it instead of the Welch
+			spectrum, as soon as it covers its time constant, so the
+			band powers follow the signal within about its tau.
+
+		render_points:
+			If set, frame() returns the signal window decimated to
+			about this many points (see MinMaxPyramid) instead of
+			every sample, e.g. twice the pixel width of the plot.
+
+		nsamples counts the decoded samples of each source,
+		queue_depth is the largest number of chunks found in a
+		queue by the last read.
+	"""
+	def __init__(self, nsources, feed, welch, resample_rate, full_rate=False,
+				sample_rate=10000, channels_per_source=1, max_lag=0.5, stats=None, render_points=None,
+				bank=None, estimator=None):
+		self.nsources = nsources
+		self.channels_per_source = channels_per_source
+		self.nchannels = nsources*channels_per_source
+		self.feed = feed
+		self.welch = welch
+		self.resample_rate = float(resample_rate)
+		self.full_rate = full_rate
+		self.sample_rate = sample_rate
+		self.max_lag = max_lag
+		self.stats = stats if stats is not None else StageTimes(enabled=False)
+		self.sources = []
+		self.data_qs = [Queue.Queue() for i in range(nsources)]
+		self.error_qs = [Queue.Queue() for i in range(nsources)]
+		self.decoders = [StreamDecoder(channels_per_source, verbose=True) for i in range(nsources)]
+		self.resamplers = [StreamingResampler(resample_rate) for i in range(nsources)]
+		self.clocks = [SampleClock(sample_rate) for i in range(nsources)]
+		self.render_points = render_points
+		self.bank = bank
+		self.estimator = estimator
+		self.pyramid = MinMaxPyramid(feed.maxlen, (self.nchannels,))
+		self.reset()
+
+	def reset(self):
+		self.feed.clear()
+		self.welch.reset()
+		self.pyramid.clear()
+		if self.bank is not None:
+			self.bank.reset()
+		if self.estimator is not None:
+			self.estimator.reset()
+		for decoder, resampler, clock in zip(self.decoders, self.resamplers, self.clocks):
+			decoder.reset()
+			resampler.reset()
+			clock.reset()
+		## grid values of each source not stacked yet
+		self.pending = [np.zeros((self.channels_per_source, 0)) for i in range(self.nsources)]
+		self.t0 = None
+		self.nstacked = 0
+		self.new_spectrum = False
+		self.ncolumns = 0
+		self.nsamples = np.zeros(self.nsources, dtype=np.int64)
+		self.queue_depth = 0
+
+	def start(self, create_source):
+		""" Start all sources, create_source(i, data_q, error_q)
+			returns the thread for source i. Returns the error
+			messages of the sources which failed.
+		"""
+		self.data_qs = [Queue.Queue() for i in range(self.nsources)]
+		self.error_qs = [Queue.Queue() for i in range(self.nsources)]
+		self.sources = [create_source(i, data_q, error_q)
+						for i, (data_q, error_q) in enumerate(zip(self.data_qs, self.error_qs))]
+		for source in self.sources:
+			source.start()
+		errors = [get_item_from_queue(error_q) for error_q in self.error_qs]
+		return [error for error in errors if error is not None]
+
+	def errors(self):
+		""" Error messages put into the error queues since the
+			last call, e.g. by a recorder of a source.
+		"""
+		return [error for error_q in self.error_qs for error in get_all_from_queue(error_q)]
+
+	def stop(self):
+		for source in self.sources:
+			source.join(0.01)
+		self.sources = []
+
+	def decode(self, i, qdata):
+		""" Returns timestamps (n,) and values (channels_per_source,
+			n) of the samples of source i in the chunks qdata.
+		"""
+		decoder, clock = self.decoders[i], self.clocks[i]
+		if self.full_rate:
+			with self.stats.timer('decode'):
+				output = decoder.decode_channels(b''.join(item[0] for item in qdata))
+			n = output.shape[-1]
+			self.nsamples[i] += output.size
+			k0 = clock.count
+			clock.update(n, qdata[-1][1])
+			return clock.times(k0, n), output.astype(float)
+		with self.stats.timer('decode'):
+			outputs = [(decoder.decode_channels(data), tstamp) for data, tstamp in qdata]
+		tstamps, values = [], []
+		for output, tstamp in outputs:
+			n = output.shape[-1]
+			self.nsamples[i] += output.size
+			if n > 0:
+				k0 = clock.count
+				clock.update(n, tstamp)
+				tstamps.append(clock.time(k0 + (n-1)/2.))
+				values.append(np.mean(output, axis=-1))
+		return np.array(tstamps), np.reshape(values, (-1, self.channels_per_source)).T
+
+	def read(self):
+		""" Move all chunks waiting in the queues into the feed,
+			returns the number of chunks.
+		"""
+		nchunks = 0
+		self.queue_depth = 0
+		for i, data_q in enumerate(self.data_qs):
+			qdata = list(get_all_from_queue(data_q))
+			self.queue_depth = max(self.queue_depth, len(qdata))
+			nchunks += len(qdata)
+			if len(qdata) == 0:
+				continue
+			t, v = self.decode(i, qdata)
+			if len(t) == 0:
+				continue
+			if self.t0 is None:
+				self.t0 = t[0]
+			resampler = self.resamplers[i]
+			if resampler.t0 is None:
+				resampler.t0 = self.t0
+				resampler.count = self.nstacked + self.pending[i].shape[-1]
+			with self.stats.timer('resample'):
+				tg, vg = resampler(t, v)
+			self.pending[i] = np.concatenate((self.pending[i], vg), axis=-1)
+		self.pad_lagging()
+
+		n = min(pending.shape[-1] for pending in self.pending)
+		if n > 0:
+			t = self.t0 + (self.nstacked + np.arange(n))/self.resample_rate
+			self.feed.extend_data(dict(timestamp=t,
+				temperature=np.concatenate([pending[:,:n] for pending in self.pending])))
+			self.pending = [pending[:,n:] for pending in self.pending]
+			self.nstacked += n
+		return nchunks
+
+	def pad_lagging(self):
+		""" Pad the sources lagging more than max_lag behind the
+			source furthest ahead with their last values.
+		"""
+		lengths = [pending.shape[-1] for pending in self.pending]
+		lead = max(lengths)
+		if lead - min(lengths) <= self.max_lag*self.resample_rate:
+			return
+		for i, resampler in enumerate(self.resamplers):
+			npad = lead - lengths[i]
+			if npad == 0:
+				continue
+			last = resampler.v_last if resampler.v_last is not None else self.pending[np.argmax(lengths)][:,0]
+			pad = np.repeat(np.reshape(last, (-1, 1)), npad, axis=-1)
+			self.pending[i] = np.concatenate((self.pending[i], pad), axis=-1)
+			## the grid of the source continues after the padding
+			if resampler.t0 is None:
+				resampler.t0 = self.t0
+			resampler.count = self.nstacked + lead
+
+	def process(self):
+		""" Filter and transform the new samples of all channels.
+		"""
+		x, y = self.feed.read_filtered()
+		start = y.shape[-1]-self.feed.nnew
+		with self.stats.timer('spectrum'):
+			if self.welch.update(y[..., start:]):
+				self.new_spectrum = True
+		if self.bank is not None:
+			with self.stats.timer('bands'):
+				self.bank(y[..., start:])
+		if self.estimator is not None:
+			with self.stats.timer('estimator'):
+				self.estimator.update(y[..., start:])
+		with self.stats.timer('decimate'):
+			self.pyramid.extend(x[start:], y[..., start:])
+
+	def frame(self):
+		""" Returns a dict with copies of the signal window, x
+			(n,) and y (nchannels, n), decimated if render_points
+			is set, the spectrogram columns computed since the last
+			frame (columns, (nchannels, nfreq, n), None without a
+			spectrogram history in welch) and, if a new segment was
+			completed since the last frame and the window is full,
+			the spectrum (freqs and spectrum, (nchannels, nfreq))
+			and the band powers (powers, dict band -> (nchannels,)),
+			which are None otherwise (with estimator, its spectrum
+			and band powers in every frame). time is the timestamp of the
+			latest sample (None before the first), envelopes the
+			relative band powers of bank (dict band -> (nchannels,),
+			None without bank).
+		"""
+		if self.render_points:
+			with self.stats.timer('decimate'):
+				x, y = self.pyramid.render(self.render_points)
+		else:
+			x, y = self.feed.filtered_t.latest().copy(), self.feed.filtered.latest().copy()
+		latest = self.feed.filtered_t.latest(1)
+		frame = dict(x=x, y=y, freqs=None, spectrum=None, powers=None, columns=None,
+			time=float(latest[-1]) if len(latest) else None,
+			envelopes=self.bank.band_powers() if self.bank is not None else None)
+		if self.welch.history is not None:
+			total = self.welch.history.total
+			frame['columns'] = self.welch.spectrogram(total - self.ncolumns).copy()
+			self.ncolumns = total
+		if self.estimator is not None:
+			if self.estimator.ready:
+				frame['freqs'] = self.estimator.freqs
+				frame['spectrum'] = self.estimator.spectrum()
+				frame['powers'] = self.estimator.band_powers()
+		elif self.new_spectrum and len(self.feed.filtered) >= self.feed.maxlen:
+			frame['freqs'] = self.welch.freqs
+			frame['spectrum'] = self.welch.spectrum()
+			frame['powers'] = self.welch.band_powers()
+		self.new_spectrum = False
+		return frame
+
+	@property
+	def spectral(self):
+		""" The source of the spectra and band powers of the
+			frames, estimator or welch.
+		"""
+		return self.estimator if self.estimator is not None else self.welch
+
+	def per_source(self, values):
+		""" Reshape values of all channels (nchannels, ...) to
+			(nsources, channels_per_source, ...).
+		"""
+		values = np.asarray(values)
+		return values.reshape((self.nsources, self.channels_per_source) + values.shape[1:])
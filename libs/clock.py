@@ -0,0 +1,147 @@
+import ctypes, ctypes.util, os, sys, time
+import numpy as np
+
+## value of the linux headers, other systems number their clocks differently
+CLOCK_MONOTONIC = 1
+
+
+def posix_monotonic():
+	""" Returns a monotonic() reading CLOCK_MONOTONIC through
+		clock_gettime of librt or libc, None if there is none or
+		the system is not linux.
+	"""
+	if not sys.platform.startswith('linux'):
+		return None
+	class timespec(ctypes.Structure):
+		_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+	for name in ('rt', 'c'):
+		path = ctypes.util.find_library(name)
+		if path is None:
+			continue
+		try:
+			clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+		except (OSError, AttributeError):
+			continue
+		clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+		def monotonic():
+			ts = timespec()
+			if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+				errno = ctypes.get_errno()
+				raise OSError(errno, os.strerror(errno))
+			return ts.tv_sec + ts.tv_nsec*1e-9
+		return monotonic
+	return None
+
+
+## time.time may jump (NTP, clock changes), time.clock is cpu time on
+## linux. python 2 has no time.monotonic, so CLOCK_MONOTONIC is read
+## directly, wall clock time remains only as the last resort
+## (is_monotonic False), SampleClock restarts on its steps.
+monotonic = getattr(time, 'monotonic', None)
+if monotonic is None:
+	try:
+		from monotonic import monotonic
+	except (ImportError, RuntimeError):
+		monotonic = posix_monotonic()
+is_monotonic = monotonic is not None
+if monotonic is None:
+	monotonic = time.time
+
+
+class SampleClock(object):
+	""" Timing model of a device sampling at a fixed rate.
+
+		Every chunk of samples is reported with its arrival time
+		(update). The arrival times are fit as a linear function
+		of the number of samples received so far by an
+		exponentially weighted least squares regression, which
+		follows the skew of the device clock against the
+		computer clock and its slow drift. Timestamps of single
+		samples are then read off the fit line, so they are
+		uniform and do not jitter with the arrival of the chunks.
+
+		rate:
+			Nominal sample rate in Hz, used until the fit is
+			established.
+
+		memory:
+			Number of updates after which an arrival has lost
+			1/e of its weight.
+
+		max_skew:
+			Bound of the relative deviation of the estimated rate
+			from rate.
+
+		max_error:
+			If an arrival is off the model by more than this (in
+			s, e.g. after samples were lost), the fit is restarted.
+			So is it if an arrival is earlier than the previous
+			one, which only a clock step can cause.
+	"""
+	def __init__(self, rate, memory=1000, max_skew=0.1, max_error=0.25, min_updates=10):
+		self.nominal_rate = float(rate)
+		self.memory = memory
+		self.max_skew = max_skew
+		self.max_error = max_error
+		self.min_updates = min_updates
+		self.reset()
+
+	def reset(self):
+		self.count = 0
+		self.t_last = None
+		self.period = 1./self.nominal_rate
+		self.restart()
+
+	def restart(self):
+		self.nupdates = 0
+		self.weight = 0.
+		self.mean_x, self.mean_t = 0., 0.
+		self.cov_xx, self.cov_xt = 0., 0.
+
+	@property
+	def rate(self):
+		return 1./self.period
+
+	@property
+	def skew(self):
+		""" Relative deviation of the estimated from the nominal
+			rate.
+		"""
+		return self.rate/self.nominal_rate - 1.
+
+	def update(self, n, t):
+		""" Account for a chunk of n new samples, the last of
+			which arrived at time t.
+		"""
+		self.count += n
+		if self.t_last is not None and t < self.t_last:
+			self.restart()
+		elif self.nupdates and abs(t - self.time(self.count-1)) > self.max_error:
+			self.restart()
+		self.t_last = t
+
+		## weighted running means and covariances (West's algorithm)
+		decay = 1. - 1./self.memory
+		self.weight = decay*self.weight + 1.
+		dx, dt = self.count - self.mean_x, t - self.mean_t
+		self.mean_x += dx/self.weight
+		self.mean_t += dt/self.weight
+		self.cov_xx = decay*self.cov_xx + dx*(self.count - self.mean_x)
+		self.cov_xt = decay*self.cov_xt + dx*(t - self.mean_t)
+		self.nupdates += 1
+
+		if self.nupdates >= self.min_updates and self.cov_xx > 0:
+			nominal = 1./self.nominal_rate
+			self.period = np.clip(self.cov_xt/self.cov_xx,
+				nominal/(1.+self.max_skew), nominal/(1.-self.max_skew))
+
+	def time(self, k):
+		""" Model time of sample k (counted from 0), k may be an
+			array or fractional.
+		"""
+		return self.mean_t + (np.asarray(k) + 1 - self.mean_x)*self.period
+
+	def times(self, k0, n):
+		""" Model times of the n samples from sample k0 on.
+		"""
+		return self.time(k0 + np.arange(n))
@@ -0,0 +1,104 @@
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
+
+
+class MinMaxPyramid(object):
+	""" Peak preserving decimation of a streaming signal for
+		plotting.
+
+		Keeps the latest capacity samples (time on the last axis,
+		shape gives the leading axes, e.g. (nchannels,)) and, at
+		every level k >= 1, the minimum and maximum of each block
+		of factor**k samples. The levels are updated incrementally
+		by extend(), each new sample is touched once per level.
+
+		render(npoints) returns the latest window at the finest
+		level with at most npoints points, as a zigzag of the
+		block minima and maxima, so spikes stay visible however
+		far the signal is decimated.
+	"""
+	def __init__(self, capacity, shape=(), factor=2, min_capacity=16):
+		self.capacity = int(capacity)
+		self.shape = tuple(shape)
+		self.factor = factor
+		## level 0 holds the samples, lo and hi are the same buffer
+		self.t = [RingBuffer(self.capacity)]
+		self.lo = [RingBuffer(self.capacity, self.shape)]
+		self.hi = [self.lo[0]]
+		block = factor
+		while self.capacity//block >= min_capacity:
+			self.t.append(RingBuffer(self.capacity//block))
+			self.lo.append(RingBuffer(self.capacity//block, self.shape))
+			self.hi.append(RingBuffer(self.capacity//block, self.shape))
+			block *= factor
+		self.clear()
+
+	@property
+	def nlevels(self):
+		return len(self.t)
+
+	def clear(self):
+		for buffer in self.t + self.lo + self.hi[1:]:
+			buffer.clear()
+		## samples of each level not filling a block of the next yet
+		self.pending = [(np.zeros(0), np.zeros(self.shape + (0,)), np.zeros(self.shape + (0,)))
+			for i in range(self.nlevels)]
+
+	def extend(self, t, values):
+		""" Append samples with timestamps t (n,) and values
+			(shape + (n,)).
+		"""
+		t, values = np.asarray(t, float), np.asarray(values, float)
+		self.t[0].extend(t)
+		self.lo[0].extend(values)
+		t, lo, hi = t, values, values
+		for k in range(1, self.nlevels):
+			pt, plo, phi = self.pending[k]
+			t = np.concatenate((pt, t))
+			lo = np.concatenate((plo, lo), axis=-1)
+			hi = np.concatenate((phi, hi), axis=-1)
+			n = len(t)//self.factor*self.factor
+			self.pending[k] = (t[n:], lo[..., n:], hi[..., n:])
+			if n == 0:
+				break
+			blocks = self.shape + (n//self.factor, self.factor)
+			t = t[:n:self.factor]
+			lo = lo[..., :n].reshape(blocks).min(axis=-1)
+			hi = hi[..., :n].reshape(blocks).max(axis=-1)
+			self.t[k].extend(t)
+			self.lo[k].extend(lo)
+			self.hi[k].extend(hi)
+
+	def render(self, npoints, duration=None):
+		""" Returns x (m,) and y (shape + (m,)) of the latest
+			samples (those of the last duration seconds if given)
+			with m about npoints at most.
+		"""
+		level, n = self.select(npoints, duration)
+		if level == 0:
+			return self.t[0].latest(n).copy(), self.lo[0].latest(n).copy()
+		t, lo, hi = self.t[level].latest(n), self.lo[level].latest(n), self.hi[level].latest(n)
+		## the samples after the last complete block form one more
+		ntail = self.t[0].total - self.t[level].total*self.factor**level
+		if ntail > 0:
+			raw = self.lo[0].latest(ntail)
+			t = np.concatenate((t, self.t[0].latest(ntail)[:1]))
+			lo = np.concatenate((lo, raw.min(axis=-1)[..., None]), axis=-1)
+			hi = np.concatenate((hi, raw.max(axis=-1)[..., None]), axis=-1)
+		x = np.repeat(t, 2)
+		y = np.stack((lo, hi), axis=-1).reshape(self.shape + (-1,))
+		return x, y
+
+	def select(self, npoints, duration=None):
+		""" Finest level showing the window in at most npoints
+			points, and the number of its entries in the window.
+		"""
+		for level in range(self.nlevels):
+			t = self.t[level].latest()
+			n = len(t)
+			if duration is not None and n > 0:
+				n -= np.searchsorted(t, t[-1]-duration)
+			if (n if level == 0 else 2*(n+1)) <= npoints:
+				return level, n
+		return level, n
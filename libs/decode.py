@@ -1,7 +1,32 @@
+from __future__ import print_function
+import time
 import numpy as np
 
 def decode_output(line):
-	line = np.fromstring(line,dtype=np.uint8)
+	""" Decode a chunk of raw serial data into 14 bit samples.
+
+		Each sample is sent as two bytes, the first one has the
+		high bit set and carries the upper 7 bits, the second one
+		carries the lower 7 bits. Everything before the first
+		frame start is skipped, a trailing odd byte is dropped.
+
+		Returns a contiguous uint16 array.
+	"""
+	line = np.frombuffer(line,dtype=np.uint8)
+	start = np.flatnonzero(line[:-1]>127)
+	if len(start)==0:
+		return np.zeros(0,dtype=np.uint16)
+	## pair every byte from the first frame start with its successor
+	frames = line[start[0]:]
+	frames = frames[:len(frames)//2*2].reshape(-1,2).astype(np.uint16)
+	return (frames[:,0] & 127)*128 + frames[:,1]
+
+
+def decode_output_loop(line):
+	""" Reference implementation of decode_output walking the
+		data byte by byte, kept for benchmarking.
+	"""
+	line = np.frombuffer(line,dtype=np.uint8)
 	foundBeginingOfFrame = 0
 	delta = 1
 	result = []
@@ -27,5 +52,171 @@ def decode_output(line):
 			result.append(intout)
 			i += 2
 	return result
-			
-	
+
+
+class StreamDecoder(object):
+	""" Incremental version of decode_output for consecutive
+		chunks of one serial stream.
+
+		A frame start byte left over at the end of a chunk is
+		kept and completed by the next chunk, so no sample is
+		lost at chunk edges. Every frame is validated (high bit
+		on the first byte only), bytes not belonging to a valid
+		frame are dropped and decoding resynchronises on the
+		next frame start.
+
+		Statistics:
+
+		nframes:
+			Number of decoded samples.
+
+		ndropped:
+			Number of bytes discarded after the stream was
+			first synchronised (each is the remainder of a
+			broken frame).
+
+		nresync:
+			Number of times the decoder lost and regained the
+			frame alignment.
+
+		With nchannels, the frames are samples of nchannels
+		interleaved channels (as sent with 'c:<nchannels>'),
+		which decode_channels demultiplexes. The first frame
+		belongs to the first channel. The frames carry no channel
+		number, so the channel of the frames after a resync
+		cannot be known: decode_channels drops the incomplete set
+		of samples before it and assigns the next frame to the
+		first channel again (counted in nphase_resets, with a
+		warning if verbose).
+	"""
+	def __init__(self, nchannels=1, verbose=False):
+		self.nchannels = nchannels
+		self.verbose = verbose
+		self.reset()
+
+	def reset(self):
+		self.leftover = np.zeros(0,dtype=np.uint8)
+		self.partial = np.zeros(0,dtype=np.uint16)
+		self.synced = False
+		self.in_garbage = False
+		self.nframes = 0
+		self.ndropped = 0
+		self.nresync = 0
+		self.nphase_resets = 0
+		## indices of the samples of the last decode following a resync
+		self.resyncs = np.zeros(0,dtype=int)
+
+	def decode(self, chunk):
+		""" Decode the next chunk of the stream, returns a
+			uint16 array with all samples completed by it.
+		"""
+		data = np.frombuffer(chunk,dtype=np.uint8)
+		if len(self.leftover):
+			data = np.concatenate((self.leftover,data))
+		high = data>127
+		start = np.flatnonzero(high[:-1] & ~high[1:])
+
+		## an unfinished frame at the end is kept for the next chunk
+		end = len(data)
+		if end and high[-1]:
+			end -= 1
+		self.leftover = data[end:].copy()
+
+		first = 0
+		self.resyncs = np.zeros(0,dtype=int)
+		if not self.synced:
+			if len(start)==0:
+				return np.zeros(0,dtype=np.uint16)
+			self.synced = True
+			first = start[0]
+
+		## runs of bytes between valid frames are dropped
+		bounds = np.concatenate(([first],start+2))
+		gaps = np.concatenate((start,[end])) - bounds
+		self.ndropped += int(np.sum(gaps))
+		runs = np.flatnonzero(gaps>0)
+		nruns = len(runs)
+		if nruns and runs[0]==0 and self.in_garbage:
+			nruns -= 1
+		self.nresync += nruns
+		## the first frame also follows garbage ending the last chunk
+		resyncs = runs[runs<len(start)]
+		if self.in_garbage and len(start) and (len(resyncs)==0 or resyncs[0]!=0):
+			resyncs = np.concatenate(([0],resyncs))
+		self.resyncs = resyncs
+		self.in_garbage = bool(gaps[-1]>0) or (self.in_garbage and len(start)==0)
+
+		self.nframes += len(start)
+		return (data[start] & 127).astype(np.uint16)*128 + data[start+1]
+
+	def decode_channels(self, chunk):
+		""" Decode the next chunk of the stream, returns an
+			array (nchannels, n) with all samples of all channels
+			completed by it.
+		"""
+		samples = self.decode(chunk)
+		resyncs = self.resyncs + len(self.partial)
+		if len(self.partial):
+			samples = np.concatenate((self.partial,samples))
+		if self.nchannels > 1 and len(resyncs):
+			samples = self.reset_phase(samples, resyncs)
+		n = len(samples)//self.nchannels
+		self.partial = samples[n*self.nchannels:]
+		return samples[:n*self.nchannels].reshape(n,self.nchannels).T
+
+	def reset_phase(self, samples, resyncs):
+		""" Drop the samples of the incomplete set before every
+			resync (indices into samples), so the first frame after
+			it is assigned to the first channel.
+		"""
+		kept = []
+		start = 0
+		for index in resyncs:
+			piece = samples[start:index]
+			## the kept pieces always hold complete sets
+			ndrop = len(piece) % self.nchannels
+			kept.append(piece[:len(piece)-ndrop])
+			start = index
+			self.nphase_resets += 1
+			if self.verbose:
+				print('[decode] frame alignment lost, channel order restarted (%d samples dropped)' % ndrop)
+		kept.append(samples[start:])
+		return np.concatenate(kept)
+
+
+def encode_output(samples):
+	""" Inverse of decode_output: pack samples (0..16383) into
+		the 2 byte frames sent by the arduino.
+	"""
+	samples = np.asarray(samples,dtype=np.uint16)
+	frames = np.empty((len(samples),2),dtype=np.uint8)
+	frames[:,0] = (samples>>7) | 128
+	frames[:,1] = samples & 127
+	return frames.tobytes()
+
+
+def benchmark_decode(nbytes=4*2**20, repeat=3):
+	""" Compare throughput (MB/s) of decode_output and
+		decode_output_loop on a synthetic capture of nbytes.
+	"""
+	samples = np.random.randint(0,1024,nbytes//2)
+	line = b'\x05' + encode_output(samples)
+
+	results = {}
+	outputs = []
+	for func in (decode_output, decode_output_loop):
+		## the byte loop is far too slow to repeat
+		best = np.inf
+		for i in range(repeat if func is decode_output else 1):
+			tstart = time.time()
+			output = func(line)
+			best = min(best, time.time()-tstart)
+		outputs.append(output)
+		results[func.__name__] = len(line)/2.**20/best
+		print('[%s] %.1f MB/s' % (func.__name__, results[func.__name__]))
+	assert np.array_equal(outputs[0], outputs[1])
+	return results
+
+
+if __name__=='__main__':
+	benchmark_decode()
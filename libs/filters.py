@@ -0,0 +1,171 @@
+import numpy as np
+from scipy.signal import butter, iirnotch, tf2sos, lfilter, lfilter_zi, sosfilt, sosfilt_zi
+
+## EEG bands in Hz
+eeg_bands = dict(delta=(0.5,4.), theta=(4.,8.), alpha=(8.,13.), beta=(13.,30.))
+
+class StreamingFilter(object):
+	""" IIR filter applied block by block to a continuous signal.
+
+		The filter state is kept between calls, so a signal filtered
+		in consecutive blocks equals the signal filtered in one go
+		and only new samples have to be processed. The state is
+		initialised from the first sample (steady state for a
+		constant input) to avoid a start-up transient.
+
+		The filter is given either as transfer function (b, a) or
+		as second-order sections sos. Blocks are filtered along the
+		last axis, leading axes (e.g. channels) are filtered
+		independently.
+	"""
+	def __init__(self, b=None, a=None, sos=None):
+		self.b, self.a, self.sos = b, a, sos
+		self.reset()
+
+	def reset(self):
+		self.zi = None
+
+	def __call__(self, x):
+		x = np.asarray(x, dtype=float)
+		if x.shape[-1] == 0:
+			return x
+		if self.sos is not None:
+			if self.zi is None:
+				zi = sosfilt_zi(self.sos)
+				self.zi = zi.reshape((zi.shape[0],) + (1,)*(x.ndim-1) + (2,)) * x[...,:1]
+			y, self.zi = sosfilt(self.sos, x, axis=-1, zi=self.zi)
+		else:
+			if self.zi is None:
+				zi = lfilter_zi(self.b, self.a)
+				self.zi = zi * x[...,:1]
+			y, self.zi = lfilter(self.b, self.a, x, axis=-1, zi=self.zi)
+		return y
+
+
+## filter designs by (kind, parameters, sample rate)
+_designs = {}
+
+def _cached(key, design):
+	if key not in _designs:
+		_designs[key] = np.asarray(design(), dtype=float)
+	return _designs[key]
+
+def butter_sos(low, high, fs, order=3):
+	""" Butterworth filter for the band low < f < high (in Hz) as
+		second-order sections, a lowpass if low is None (or <= 0),
+		a highpass if high is None (or >= fs/2). Designs are cached.
+	"""
+	nyq = fs/2.
+	if low is not None and low <= 0:
+		low = None
+	if high is not None and high >= nyq:
+		high = None
+	if low is None and high is None:
+		raise ValueError('empty filter band')
+	if low is None:
+		args = (high/nyq, 'lowpass')
+	elif high is None:
+		args = (low/nyq, 'highpass')
+	else:
+		args = ([low/nyq, high/nyq], 'bandpass')
+	return _cached(('butter', low, high, float(fs), order),
+		lambda: butter(order, args[0], btype=args[1], output='sos'))
+
+def notch_sos(freq, fs, q=30.):
+	""" Notch at freq Hz (e.g. the mains frequency) with quality
+		factor q as second-order sections. Designs are cached.
+	"""
+	return _cached(('notch', freq, float(fs), q),
+		lambda: tf2sos(*iirnotch(freq/(fs/2.), q)))
+
+def signal_sos(fs, cutoff=170., mains=50., order=3):
+	""" Filter of the displayed signal: Butterworth lowpass at
+		cutoff Hz followed by a notch at mains Hz (None for none).
+	"""
+	sos = [butter_sos(None, cutoff, fs, order)]
+	if mains is not None and mains < fs/2.:
+		sos.append(notch_sos(mains, fs))
+	return np.vstack(sos)
+
+
+class FilterBank(object):
+	""" Bandpass filters of the EEG bands applied to a continuous
+		multi-channel signal, with the power envelope of each band.
+
+		All bands are filtered from the same block (shape + (n,),
+		time on the last axis): one sosfilt call per band filters
+		all channels, the squared band signals of all bands and
+		channels are smoothed by one exponential average (time
+		constant tau in s) into the power envelopes. The band power
+		is thus available after every block, without waiting for an
+		FFT window.
+
+		Butterworth designs (order per band edge) are cached by
+		sample rate, see set_rate. With mains, a notch at the mains
+		frequency is applied before the bands.
+
+		total:
+			Names of the bands whose powers add up to the total
+			for band_powers(relative=True), default those of
+			eeg_bands.
+	"""
+	def __init__(self, fs, bands=None, order=2, mains=50., tau=0.2, total=None, shape=()):
+		self.bands = dict(eeg_bands if bands is None else bands)
+		self.names = sorted(self.bands)
+		self.order = order
+		self.mains = mains
+		self.tau = tau
+		self.shape = tuple(shape)
+		self.total = [name for name in (total or sorted(eeg_bands)) if name in self.bands]
+		self.fs = None
+		self.set_rate(fs)
+
+	def set_rate(self, fs, rtol=1e-2):
+		""" Switch to the (cached) designs for sample rate fs, unless
+			it is within rtol of the current one.
+		"""
+		if self.fs is not None and abs(fs-self.fs) <= rtol*self.fs:
+			return
+		self.fs = float(fs)
+		self.notch = None
+		if self.mains is not None and self.mains < self.fs/2.:
+			self.notch = StreamingFilter(sos=notch_sos(self.mains, self.fs))
+		self.filters = [StreamingFilter(sos=butter_sos(low, high, self.fs, self.order))
+						for low, high in (self.bands[name] for name in self.names)]
+		alpha = 1. - np.exp(-1./(self.tau*self.fs))
+		self.smoothing = StreamingFilter([alpha], [1., alpha-1.])
+		self.reset()
+
+	def reset(self):
+		if self.notch is not None:
+			self.notch.reset()
+		for f in self.filters:
+			f.reset()
+		self.smoothing.reset()
+		self.power = np.zeros((len(self.names),) + self.shape)
+
+	def __call__(self, x):
+		""" Filter a block x (shape + (n,)), returns the band
+			signals (nbands,) + shape + (n,), bands in the order of
+			names.
+		"""
+		x = np.asarray(x, dtype=float)
+		out = np.empty((len(self.names),) + x.shape)
+		if x.shape[-1] == 0:
+			return out
+		if self.notch is not None:
+			x = self.notch(x)
+		for k, f in enumerate(self.filters):
+			out[k] = f(x)
+		self.power = self.smoothing(out**2)[..., -1]
+		return out
+
+	def band_powers(self, relative=True):
+		""" Dict band name -> current power envelope (shape),
+			relative to the sum of the total bands if relative.
+		"""
+		total = 1.
+		if relative:
+			total = np.sum([self.power[self.names.index(name)] for name in self.total], axis=0)
+			total = np.where(total > 0, total, 1.)
+		return dict((name, self.power[k]/total) for k, name in enumerate(self.names))
@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class BallGame(object):
+	""" Ball physics of the mind ball game, independent of the
+		acquisition and of the GUI.
+
+		The ball moves in fixed steps of dt seconds of signal time,
+		each step by drive*tuning_factor along x (drive is the
+		alpha power of the player, or the difference of the powers
+		of player 2 and player 1) and by a random amount along y. If
+		the ball leaves the field, abs(y) > 0.7*(1.1-abs(x)), y is
+		damped; if abs(x) > 1, a goal is scored: the game stops and
+		winner is 0 for a goal on the left (or with one player), 1
+		on the right.
+
+		The state (x, y, playing, winner) consists of arrays of the
+		shape of tuning_factor, so many games with different tuning
+		factors can be run at once from the same drive, e.g. to tune
+		tuning_factor on recorded sessions. The random numbers come
+		from a RandomState seeded with seed, so a game can be
+		reproduced exactly.
+
+		nplayers:
+			1 or 2, the direction the ball may move and the goals.
+
+		noise:
+			Std of the random step along y.
+
+		damping:
+			Fraction of y removed when the ball leaves the field.
+	"""
+	def __init__(self, nplayers=2, tuning_factor=5., dt=0.1, noise=0.05, damping=0.3, seed=None):
+		self.nplayers = nplayers
+		self.tuning_factor = np.asarray(tuning_factor, dtype=float)
+		self.dt = dt
+		self.noise = noise
+		self.damping = damping
+		self.seed = seed
+		self.rng = np.random.RandomState(seed)
+		self.reset()
+
+	@property
+	def shape(self):
+		return self.tuning_factor.shape
+
+	def reset(self):
+		""" Ball back to the center, the game is not playing.
+		"""
+		self.x = np.zeros(self.shape)
+		self.y = np.zeros(self.shape)
+		self.playing = np.zeros(self.shape, dtype=bool)
+		self.winner = np.full(self.shape, -1)
+		self.nsteps = 0
+		## signal time of the last step and the drive held since
+		self.t = None
+		self.drive = None
+
+	def start(self, seed=None):
+		""" Reset and start playing, reseeded with seed if given.
+		"""
+		if seed is not None:
+			self.seed = seed
+			self.rng = np.random.RandomState(seed)
+		self.reset()
+		self.playing[...] = True
+
+	def restart(self, mask):
+		""" Put the ball of the games in mask back to the center
+			and play them again, e.g. after a goal.
+		"""
+		self.x[mask] = 0.
+		self.y[mask] = 0.
+		self.winner[mask] = -1
+		self.playing[mask] = True
+
+	@property
+	def ball(self):
+		""" Position to draw, x limited to the goal line.
+		"""
+		return np.clip(self.x, -1., 1.), self.y
+
+	def step(self, drive):
+		""" Advance all games by one step, returns the mask of the
+			games which ended with this step.
+		"""
+		playing = self.playing.copy()
+		self.x += np.where(playing, drive*self.tuning_factor, 0.)
+		if self.noise:
+			self.y += np.where(playing, self.rng.normal(scale=self.noise, size=self.shape), 0.)
+		out = playing & (np.abs(self.y) > 0.7*(1.1-np.abs(self.x)))
+		self.y = np.where(out, (1.-self.damping)*self.y, self.y)
+		goal = playing & (np.abs(self.x) > 1)
+		self.playing &= ~goal
+		self.winner = np.where(goal, (self.x > 0).astype(int) if self.nplayers > 1 else 0, self.winner)
+		self.nsteps += 1
+		return goal
+
+	def advance(self, t, drive=None):
+		""" Run the steps due up to signal time t, with the latest
+			drive (held until the next one arrives). Returns the
+			mask of the games which ended.
+		"""
+		if drive is not None:
+			self.drive = drive
+		ended = np.zeros(self.shape, dtype=bool)
+		if self.t is None or self.drive is None:
+			self.t = t
+			return ended
+		nsteps = int((t - self.t)/self.dt + 1e-9)
+		for i in range(nsteps):
+			if not self.playing.any():
+				break
+			ended |= self.step(self.drive)
+		self.t += nsteps*self.dt
+		return ended
+
+	def run(self, drives):
+		""" Play the steps of the given drives (nsteps,) from the
+			current state, returns the number of steps until the
+			goal of each game (-1 if none).
+		"""
+		steps = np.full(self.shape, -1)
+		for i, drive in enumerate(drives):
+			ended = self.step(drive)
+			steps[ended] = i+1
+			if not self.playing.any():
+				break
+		return steps
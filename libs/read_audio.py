@@ -3,6 +3,9 @@ import wave
 
 
 def play_sound(path_to_file):
+    """ Play a WAV file, blocking until it has finished. The
+        monitors use the non-blocking libs.audio.AudioEngine.
+    """
 
     #define stream chunk
     chunk = 1024
@@ -19,8 +22,8 @@ def play_sound(path_to_file):
     #read data
     data = f.readframes(chunk)
 
-    #play stream
-    while data != '':
+    #play stream, readframes returns an empty string at the end
+    while len(data) > 0:
         stream.write(data)
         data = f.readframes(chunk)
 
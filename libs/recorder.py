@@ -0,0 +1,146 @@
+from __future__ import print_function
+import struct, threading, time
+import Queue
+import numpy as np
+
+## file layout: magic, then one record per chunk:
+## timestamp (float64), length (uint32), raw data
+magic = b'EEGREC1\n'
+record_header = struct.Struct('<dI')
+
+
+class SessionRecorder(threading.Thread):
+	""" A thread writing the raw chunks read from a serial port,
+		together with their timestamps, to a binary file.
+
+		write() only puts the chunk into a queue, so the serial
+		read loop is never blocked by the disk. The thread writes
+		everything queued through a buffered file and flushes it
+		after each batch.
+
+		If the file cannot be opened or written (e.g. a missing
+		directory or a full disk), failed is set, the message is
+		put into error_q (if given) and write() does nothing from
+		then on, as after the recorder was stopped.
+
+		Statistics (see stats()):
+
+		nbytes/nrecords:
+			Raw bytes and chunks written so far.
+
+		flush_latency/max_flush_latency:
+			Time from write() of the oldest chunk in a batch to the
+			end of the flush, for the last batch and at most.
+	"""
+	def __init__(self, path, buffering=2**16, verbose=True, error_q=None):
+		threading.Thread.__init__(self)
+		self.path = path
+		self.buffering = buffering
+		self.verbose = verbose
+		self.error_q = error_q
+		self.queue = Queue.Queue()
+		self.alive = threading.Event()
+		self.alive.set()
+		self.failed = False
+
+		self.nbytes = 0
+		self.nrecords = 0
+		self.flush_latency = 0.
+		self.max_flush_latency = 0.
+		self.tstart = time.time()
+
+	def write(self, data, timestamp):
+		if self.failed or not self.alive.isSet():
+			return
+		self.queue.put((data, timestamp, time.time()))
+
+	def run(self):
+		self.tstart = time.time()
+		try:
+			f = open(self.path, 'wb', self.buffering)
+		except (IOError, OSError) as e:
+			self.fail(e)
+			return
+		try:
+			f.write(magic)
+			while self.alive.isSet() or not self.queue.empty():
+				try:
+					items = [self.queue.get(True, 0.1)]
+				except Queue.Empty:
+					continue
+				try:
+					while True:
+						items.append(self.queue.get_nowait())
+				except Queue.Empty:
+					pass
+
+				for data, timestamp, tput in items:
+					f.write(record_header.pack(timestamp, len(data)))
+					f.write(data)
+					self.nbytes += len(data)
+				f.flush()
+				self.nrecords += len(items)
+				self.flush_latency = time.time() - items[0][2]
+				self.max_flush_latency = max(self.max_flush_latency, self.flush_latency)
+		except (IOError, OSError) as e:
+			self.fail(e)
+		finally:
+			try:
+				f.close()
+			except (IOError, OSError):
+				pass
+		if self.failed:
+			return
+
+		if self.verbose:
+			print('[recorder] %s: %d bytes, %.1f kB/s, max flush latency %.1f ms' % (self.path,
+				self.nbytes, self.stats()['bytes_per_second']/1e3, 1e3*self.max_flush_latency))
+
+	def fail(self, error):
+		""" Stop recording after error, drop the queued chunks.
+		"""
+		self.failed = True
+		self.alive.clear()
+		message = 'cannot record to %s: %s' % (self.path, error)
+		if self.error_q is not None:
+			self.error_q.put(message)
+		if self.verbose:
+			print('[recorder] ' + message)
+		try:
+			while True:
+				self.queue.get_nowait()
+		except Queue.Empty:
+			pass
+
+	def stats(self):
+		elapsed = max(time.time() - self.tstart, 1e-9)
+		return dict(nbytes=self.nbytes, nrecords=self.nrecords,
+					bytes_per_second=self.nbytes/elapsed,
+					flush_latency=self.flush_latency,
+					max_flush_latency=self.max_flush_latency)
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
+
+
+def read_index(buf):
+	""" Index of the records in buf (the contents of a recorded
+		file, e.g. an mmap). Returns arrays of the timestamps and
+		of the offsets and lengths of the raw data.
+	"""
+	if buf[:len(magic)] != magic:
+		raise ValueError('not a session recording')
+	timestamps, offsets, lengths = [], [], []
+	offset = len(magic)
+	while offset + record_header.size <= len(buf):
+		timestamp, length = record_header.unpack_from(buf, offset)
+		offset += record_header.size
+		if offset + length > len(buf):
+			## incomplete last record
+			break
+		timestamps.append(timestamp)
+		offsets.append(offset)
+		lengths.append(length)
+		offset += length
+	return np.array(timestamps), np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
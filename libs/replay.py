@@ -0,0 +1,105 @@
+import mmap, threading, time
+import numpy as np
+
+from libs.recorder import read_index
+from libs.clock import monotonic
+
+
+def iter_chunks(buf, index, chunk_size=None):
+	""" Generator yielding (data, timestamp) pairs of a recording
+		buf with the given read_index. With chunk_size, the data is
+		cut into pieces of chunk_size bytes instead of the recorded
+		chunks, each timestamped like the chunk its last byte is from.
+	"""
+	timestamps, offsets, lengths = index
+	if chunk_size is None:
+		for timestamp, offset, length in zip(timestamps, offsets, lengths):
+			yield buf[offset:offset+length], timestamp
+		return
+
+	ends = np.cumsum(lengths)
+	starts = ends - lengths
+	total = ends[-1] if len(ends) else 0
+	for start in range(0, total, chunk_size):
+		end = min(start+chunk_size, total)
+		first = np.searchsorted(ends, start, 'right')
+		last = np.searchsorted(ends, end-1, 'right')
+		data = b''.join(buf[offsets[i]+max(0, start-starts[i]):offsets[i]+min(lengths[i], end-starts[i])]
+						for i in range(first, last+1))
+		yield data, timestamps[last]
+
+
+class ReplayThread(threading.Thread):
+	""" Drop-in replacement of ComMonitorThread replaying a file
+		written by SessionRecorder instead of reading a COM port.
+
+		The file is read through mmap, chunks are put into data_q
+		as (data, timestamp) pairs with their recorded timestamps,
+		errors (e.g. a missing file) go to error_q.
+
+		realtime:
+			Keep the recorded timing between chunks (scaled by
+			1/speed), otherwise replay as fast as possible.
+
+		chunk_size:
+			Replay chunks of this many bytes instead of the
+			recorded chunks.
+
+		data_ready:
+			Optional threading.Event, set after every chunk.
+
+		When the replay is done or failed, finished is set.
+	"""
+	def __init__(   self,
+					data_q, error_q,
+					path,
+					realtime=True,
+					speed=1.,
+					chunk_size=None,
+					data_ready=None):
+		threading.Thread.__init__(self)
+		self.data_q = data_q
+		self.error_q = error_q
+		self.path = path
+		self.realtime = realtime
+		self.speed = speed
+		self.chunk_size = chunk_size
+		self.data_ready = data_ready
+
+		self.alive = threading.Event()
+		self.alive.set()
+		self.finished = threading.Event()
+
+	def run(self):
+		f = buf = None
+		try:
+			f = open(self.path, 'rb')
+			buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			index = read_index(buf)
+			self.replay(buf, index)
+		except (IOError, OSError, ValueError) as e:
+			self.error_q.put('%s: %s' % (self.path, e))
+		finally:
+			if buf is not None:
+				buf.close()
+			if f is not None:
+				f.close()
+			self.finished.set()
+
+	def replay(self, buf, index):
+		tstart = monotonic()
+		t0 = index[0][0] if len(index[0]) else 0.
+		for data, timestamp in iter_chunks(buf, index, self.chunk_size):
+			if not self.alive.isSet():
+				break
+			if self.realtime:
+				delay = tstart + (timestamp-t0)/self.speed - monotonic()
+				if delay > 0:
+					time.sleep(delay)
+			self.data_q.put((data, timestamp))
+			if self.data_ready is not None:
+				self.data_ready.set()
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
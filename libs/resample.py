@@ -0,0 +1,51 @@
+import numpy as np
+
+class StreamingResampler(object):
+	""" Converts (timestamp, value) samples arriving at irregular
+		times into a series on a uniform grid with rate fs.
+
+		Values are interpolated linearly. Only new samples are
+		processed on each call, the last sample and the position
+		on the grid are kept, so consecutive calls continue the same
+		grid (t0 + k/fs) without gaps or repeated points.
+
+		Values may have leading axes (e.g. (nchannels, n)), which
+		share the timestamps.
+	"""
+	def __init__(self, fs):
+		self.fs = float(fs)
+		self.reset()
+
+	def reset(self):
+		self.t0 = None
+		self.count = 0
+		self.t_last = None
+		self.v_last = None
+
+	def __call__(self, t, v):
+		""" Returns the grid points (tg, vg) covered by the new
+			samples (t, v).
+		"""
+		t = np.asarray(t, dtype=float)
+		v = np.asarray(v, dtype=float)
+		if len(t) == 0:
+			return t, v
+		if self.t_last is not None:
+			t = np.concatenate(([self.t_last], t))
+			v = np.concatenate((self.v_last[...,None], v), axis=-1)
+		## timestamps of separate chunks may overlap slightly
+		t = np.maximum.accumulate(t)
+		if self.t0 is None:
+			self.t0 = t[0]
+		self.t_last, self.v_last = t[-1], v[...,-1]
+
+		kmax = int(np.floor((t[-1]-self.t0)*self.fs)) + 1
+		tg = self.t0 + np.arange(self.count, max(kmax, self.count))/self.fs
+		self.count += len(tg)
+
+		i = np.clip(np.searchsorted(t, tg, 'right')-1, 0, max(len(t)-2, 0))
+		j = np.minimum(i+1, len(t)-1)
+		dt = t[j]-t[i]
+		## grid points before the first sample take its value
+		w = np.clip(np.where(dt>0, (tg-t[i])/np.where(dt>0, dt, 1.), 0.), 0., 1.)
+		return tg, v[...,i]*(1.-w) + v[...,j]*w
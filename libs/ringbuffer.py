@@ -0,0 +1,68 @@
+import numpy as np
+
+class RingBuffer(object):
+	""" Fixed capacity buffer holding the most recent samples in a
+		preallocated numpy array.
+
+		The time axis is the last one, shape gives the leading axes
+		(e.g. (nchannels,)). Every sample is written twice, at i and
+		i+capacity, so that the latest n samples are always one
+		contiguous slice and latest() returns a view without copying.
+
+		extend(values):
+			Append an array of samples (shape + (n,)).
+
+		latest(n=None):
+			View of the latest n samples (all stored if None). The
+			view is only valid until the next extend().
+
+		total:
+			Number of samples appended since the last clear(), lets
+			readers find out how many samples are new to them.
+	"""
+	def __init__(self, capacity, shape=(), dtype=float):
+		self.capacity = int(capacity)
+		self.shape = tuple(shape)
+		self.data = np.zeros(self.shape + (2*self.capacity,), dtype=dtype)
+		self.clear()
+
+	def clear(self):
+		self.head = 0
+		self.count = 0
+		self.total = 0
+
+	def __len__(self):
+		return self.count
+
+	def append(self, value):
+		self.data[..., self.head] = value
+		self.data[..., self.head+self.capacity] = value
+		self.head = (self.head+1) % self.capacity
+		self.count = min(self.count+1, self.capacity)
+		self.total += 1
+
+	def extend(self, values):
+		values = np.asarray(values)
+		n = values.shape[-1]
+		self.total += n
+		if n >= self.capacity:
+			values = values[..., n-self.capacity:]
+			self.data[..., :self.capacity] = values
+			self.data[..., self.capacity:] = values
+			self.head = 0
+			self.count = self.capacity
+			return
+		## at most two contiguous pieces, each written to both halves
+		first = min(n, self.capacity-self.head)
+		for start, piece in ((self.head, values[..., :first]), (0, values[..., first:])):
+			k = piece.shape[-1]
+			self.data[..., start:start+k] = piece
+			self.data[..., start+self.capacity:start+self.capacity+k] = piece
+		self.head = (self.head+n) % self.capacity
+		self.count = min(self.count+n, self.capacity)
+
+	def latest(self, n=None):
+		if n is None or n > self.count:
+			n = self.count
+		end = self.head + self.capacity
+		return self.data[..., end-n:end]
@@ -0,0 +1,77 @@
+import numpy as np
+import pyqtgraph as pg
+
+from libs.ringbuffer import RingBuffer
+
+
+def make_lut(colors=((0,0,0), (40,0,120), (200,30,80), (255,180,0), (255,255,220)), n=256):
+	""" Lookup table (n, 3) interpolating linearly between colors.
+	"""
+	colors = np.asarray(colors, float)
+	pos = np.linspace(0., 1., len(colors))
+	x = np.linspace(0., 1., n)
+	return np.column_stack([np.interp(x, pos, colors[:,i]) for i in range(3)]).astype(np.ubyte)
+
+
+class SpectrogramView(pg.PlotWidget):
+	""" Scrolling spectrogram of one channel.
+
+		The last ncolumns spectra (in dB, up to fmax) are kept in a
+		RingBuffer, update_columns() appends the new columns and
+		uploads the whole buffer to a single ImageItem, so the cost
+		per frame does not depend on the length of the session.
+
+		freqs:
+			Frequency axis of the spectra (SpectralEngine.freqs).
+
+		hop_time:
+			Time between two columns in s, the x axis shows the
+			seconds before the latest column.
+
+		levels:
+			Color range (low, high) in dB, taken from the first
+			columns if None.
+
+		magnitude:
+			The spectra are magnitudes (SpectralEngine with
+			magnitude=True) instead of powers.
+	"""
+	def __init__(self, ncolumns, freqs, hop_time, fmax=40., levels=None, magnitude=False, parent=None):
+		super(SpectrogramView, self).__init__(parent)
+		self.nfreq = np.searchsorted(freqs, fmax, 'right')
+		self.levels = levels
+		self.db_factor = 20. if magnitude else 10.
+		self.columns = RingBuffer(ncolumns, (self.nfreq,))
+
+		self.image = pg.ImageItem()
+		self.image.setLookupTable(make_lut())
+		self.addItem(self.image)
+		## image pixel (i, k) is column i and frequency bin k
+		df = freqs[1] - freqs[0]
+		self.image.setPos(-ncolumns*hop_time, freqs[0] - df/2.)
+		self.image.scale(hop_time, df)
+		self.setLabel('bottom', 'Time [s]')
+		self.setLabel('left', 'Frequency [Hz]')
+		self.setXRange(-ncolumns*hop_time, 0, padding=0)
+		self.setYRange(0, freqs[self.nfreq-1], padding=0)
+		self.clear_columns()
+
+	def clear_columns(self):
+		""" Fill the buffer with the lowest level, so the image
+			always spans ncolumns.
+		"""
+		floor = self.levels[0] if self.levels is not None else -200.
+		self.columns.clear()
+		self.columns.extend(np.full((self.nfreq, self.columns.capacity), floor))
+		self.image.setImage(self.columns.latest().T, autoLevels=False, levels=self.levels or (0., 1.))
+
+	def update_columns(self, spectra):
+		""" Append spectra (nfreq of the engine, n), not in dB.
+		"""
+		if spectra.shape[-1] == 0:
+			return
+		db = self.db_factor*np.log10(spectra[:self.nfreq] + 1e-12)
+		if self.levels is None:
+			self.levels = tuple(np.percentile(db, (5, 99.5)))
+		self.columns.extend(db)
+		self.image.setImage(self.columns.latest().T, autoLevels=False, levels=self.levels)
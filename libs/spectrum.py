@@ -0,0 +1,240 @@
+import numpy as np
+from scipy.signal import get_window
+
+from libs.ringbuffer import RingBuffer
+from libs.filters import StreamingFilter, butter_sos
+
+## EEG bands in Hz
+default_bands = dict(theta=(4.,8.), alpha=(8.,13.), beta=(13.,30.))
+
+class SpectralEngine(object):
+	""" Welch spectrum of a continuous signal, updated as new
+		samples arrive.
+
+		The signal is cut into segments of nperseg samples which
+		overlap by noverlap samples. Each segment is detrended,
+		tapered and transformed once, the spectrum is the average
+		over the last nseg segments. Frequency axis, taper and the
+		index slices of the bands are computed once per sample
+		rate.
+
+		fs:
+			Sample rate in Hz, see set_rate.
+
+		bands:
+			Dict name -> (low, high) in Hz, band power sums the bins
+			with low < f < high.
+
+		magnitude:
+			Average |rfft| instead of |rfft|**2.
+
+		shape:
+			Leading axes of the signal (e.g. (nchannels,)), the
+			time axis is the last one.
+
+		history:
+			Number of segment spectra kept for a spectrogram
+			(columns, one per hop), 0 for none.
+	"""
+	def __init__(self, fs, nperseg, noverlap=None, nseg=4, window='hann',
+				bands=None, magnitude=False, shape=(), history=0):
+		self.nperseg = nperseg
+		self.hop = nperseg - (nperseg//2 if noverlap is None else noverlap)
+		self.shape = tuple(shape)
+		self.bands = dict(default_bands if bands is None else bands)
+		self.magnitude = magnitude
+
+		self.taper = get_window(window, nperseg)
+		self.nfreq = nperseg//2 + 1
+		self.segments = RingBuffer(nseg, self.shape + (self.nfreq,))
+		self.history = RingBuffer(history, self.shape + (self.nfreq,)) if history else None
+		self.fs = None
+		self.set_rate(fs)
+		self.reset()
+
+	def set_rate(self, fs, rtol=1e-2):
+		""" Recompute frequency axis and band slices, unless fs is
+			within rtol of the current sample rate.
+		"""
+		if self.fs is not None and abs(fs-self.fs) <= rtol*self.fs:
+			return
+		self.fs = float(fs)
+		self.freqs = np.fft.rfftfreq(self.nperseg, d=1./self.fs)
+		self.band_slices = {}
+		for name, (low, high) in self.bands.items():
+			self.band_slices[name] = slice(np.searchsorted(self.freqs, low, 'right'),
+										np.searchsorted(self.freqs, high, 'left'))
+		## density scaling of the one-sided spectrum
+		if self.magnitude:
+			self.scale = np.full(self.nfreq, 1./np.sum(self.taper))
+		else:
+			self.scale = np.full(self.nfreq, 1./(self.fs*np.sum(self.taper**2)))
+		self.scale[1:self.nperseg-self.nfreq+1] *= 2
+
+	def reset(self):
+		self.segments.clear()
+		if self.history is not None:
+			self.history.clear()
+		self.pending = np.zeros(self.shape + (0,))
+
+	def update(self, x):
+		""" Add new samples (shape + (n,)), returns the number of
+			segments completed by them.
+		"""
+		buf = np.concatenate((self.pending, np.asarray(x, dtype=float)), axis=-1)
+		nnew = (buf.shape[-1] - self.nperseg)//self.hop + 1
+		if nnew <= 0:
+			self.pending = buf
+			return 0
+		## only the last nseg segments contribute (or are kept)
+		keep = max(self.segments.capacity, self.history.capacity if self.history is not None else 0)
+		first = max(0, nnew - keep)
+		index = np.arange(first, nnew)[:,None]*self.hop + np.arange(self.nperseg)
+		seg = buf[..., index]
+		seg = (seg - seg.mean(axis=-1)[...,None]) * self.taper
+		spec = np.abs(np.fft.rfft(seg, axis=-1))
+		if not self.magnitude:
+			spec **= 2
+		spec = np.swapaxes(spec*self.scale, -1, -2)
+		self.segments.extend(spec)
+		if self.history is not None:
+			self.history.extend(spec)
+		self.pending = buf[..., nnew*self.hop:]
+		return nnew
+
+	def spectrum(self):
+		""" Average spectrum of the last nseg segments, shape +
+			(nfreq,). Zeros before the first segment is complete.
+		"""
+		if len(self.segments) == 0:
+			return np.zeros(self.shape + (self.nfreq,))
+		return self.segments.latest().mean(axis=-1)
+
+	def spectrogram(self, n=None):
+		""" View of the latest n segment spectra kept (all if
+			None), shape + (nfreq, n), oldest first.
+		"""
+		return self.history.latest(n)
+
+	def band_powers(self, relative=True):
+		""" Dict band name -> power of the current spectrum in that
+			band, relative to the total power without DC if relative.
+		"""
+		spec = self.spectrum()
+		total = np.sum(spec[...,1:], axis=-1) if relative else 1.
+		if relative:
+			## a flat channel (e.g. a disconnected electrode) has no power
+			total = np.where(total > 0, total, 1.)
+		return dict((name, np.sum(spec[...,sl], axis=-1)/total)
+					for name, sl in self.band_slices.items())
+
+
+class RecursiveSpectrum(object):
+	""" Exponentially weighted spectrum of a continuous signal,
+		updated with every sample.
+
+		Every frequency bin is a damped Goertzel resonator,
+		s[n] = p*s[n-1] + x[n] with p = exp(-1/(tau*fs) + 2j*pi*f/fs),
+		i.e. the DFT of the signal under an exponential window of
+		time constant tau. The cost is O(1) per sample and bin, and
+		the band powers follow the signal with a delay of about tau
+		instead of the window length of SpectralEngine. A block of
+		samples is applied at once as a product with the powers of
+		p, which are cached by block length.
+
+		The frequency axis is the one of SpectralEngine with nperseg
+		(up to fmax if given, the total of relative band powers is
+		then taken up to fmax). Before the resonators, a highpass at
+		highpass Hz removes the DC offset, whose leakage would
+		otherwise dominate the low bins.
+
+		fs, bands, magnitude, shape:
+			As for SpectralEngine, which this can replace.
+	"""
+	def __init__(self, fs, nperseg, tau=0.1, bands=None, magnitude=False, shape=(), fmax=None,
+				highpass=0.5):
+		self.nperseg = nperseg
+		self.tau = tau
+		self.bands = dict(default_bands if bands is None else bands)
+		self.magnitude = magnitude
+		self.shape = tuple(shape)
+		self.fmax = fmax
+		self.highpass = highpass
+		self.fs = None
+		self.set_rate(fs)
+
+	def set_rate(self, fs, rtol=1e-2):
+		""" Recompute frequency axis, band slices and resonators,
+			unless fs is within rtol of the current sample rate.
+		"""
+		if self.fs is not None and abs(fs-self.fs) <= rtol*self.fs:
+			return
+		self.fs = float(fs)
+		freqs = np.fft.rfftfreq(self.nperseg, d=1./self.fs)
+		self.freqs = freqs[:np.searchsorted(freqs, self.fmax, 'right')] if self.fmax else freqs
+		self.nfreq = len(self.freqs)
+		self.band_slices = {}
+		for name, (low, high) in self.bands.items():
+			self.band_slices[name] = slice(np.searchsorted(self.freqs, low, 'right'),
+										np.searchsorted(self.freqs, high, 'left'))
+		decay = np.exp(-1./(self.tau*self.fs))
+		self.pole = decay*np.exp(2j*np.pi*self.freqs/self.fs)
+		## normalizes a sinusoid to its amplitude
+		self.scale = 2*(1.-decay)
+		self.filter = StreamingFilter(sos=butter_sos(self.highpass, None, self.fs, 2)) if self.highpass else None
+		self.weights = {}
+		self.reset()
+
+	def reset(self):
+		self.state = np.zeros(self.shape + (self.nfreq,), dtype=complex)
+		self.nsamples = 0
+		if self.filter is not None:
+			self.filter.reset()
+
+	@property
+	def ready(self):
+		""" True once the signal covers the time constant.
+		"""
+		return self.nsamples >= self.tau*self.fs
+
+	def block_weights(self, n):
+		""" Powers p**(n-1-m) (n, nfreq) of a block of n samples
+			and p**n.
+		"""
+		if n not in self.weights:
+			if len(self.weights) > 64:
+				self.weights.clear()
+			powers = self.pole**np.arange(n+1)[:,None]
+			self.weights[n] = powers[n-1::-1], powers[n]
+		return self.weights[n]
+
+	def update(self, x, max_block=1024):
+		""" Add new samples (shape + (n,)), returns their number.
+		"""
+		x = np.asarray(x, dtype=float)
+		if self.filter is not None:
+			x = self.filter(x)
+		n = x.shape[-1]
+		for start in range(0, n, max_block):
+			block = x[..., start:start+max_block]
+			weights, decay = self.block_weights(block.shape[-1])
+			self.state = self.state*decay + np.dot(block, weights)
+		self.nsamples += n
+		return n
+
+	def spectrum(self):
+		""" Current spectrum, shape + (nfreq,).
+		"""
+		spec = self.scale*np.abs(self.state)
+		return spec if self.magnitude else spec**2
+
+	def band_powers(self, relative=True):
+		""" Dict band name -> power of the current spectrum in that
+			band, relative to the total power without DC if relative.
+		"""
+		spec = self.spectrum()
+		total = np.sum(spec[...,1:], axis=-1) if relative else 1.
+		if relative:
+			total = np.where(total > 0, total, 1.)
+		return dict((name, np.sum(spec[...,sl], axis=-1)/total)
+					for name, sl in self.band_slices.items())
@@ -0,0 +1,97 @@
+import numpy as np
+
+from libs.filters import StreamingFilter
+from libs.decode import encode_output
+
+## filter turning white into pink (1/f) noise, accurate
+## to about 0.05 dB above fs/1000 (P. Kellet)
+pink_b = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+pink_a = np.array([1., -2.494956002, 2.017265875, -0.522189400])
+
+class SyntheticEEG(object):
+	""" Continuous synthetic EEG: pink noise plus bursts of alpha
+		oscillation, as samples of the 10 bit ADC of the arduino
+		(around 512, the range the monitors show), clipped to the
+		14 bit range of the frames.
+
+		fs:
+			Sample rate in Hz.
+
+		nchannels:
+			Number of independent channels.
+
+		noise:
+			Standard deviation of the pink noise in ADC units.
+
+		alpha:
+			Peak amplitude of the alpha bursts in ADC units, may
+			be changed at any time (scalar or one per channel).
+
+		alpha_freq:
+			Frequency of the alpha oscillation in Hz.
+
+		burst_rate/burst_length:
+			Mean number of bursts per second and duration of a
+			burst in seconds. Bursts start at random times and
+			have a Hann envelope.
+
+		offset:
+			Zero line of the signal in ADC units.
+	"""
+	def __init__(self, fs, nchannels=1, noise=10., alpha=20., alpha_freq=10.,
+				burst_rate=0.5, burst_length=1., offset=512, seed=None):
+		self.fs = float(fs)
+		self.nchannels = nchannels
+		self.noise = noise
+		self.alpha = alpha
+		self.alpha_freq = alpha_freq
+		self.burst_rate = burst_rate
+		self.burst_length = burst_length
+		self.offset = offset
+		self.rng = np.random.RandomState(seed)
+		self.pink = StreamingFilter(pink_b, pink_a)
+		self.reset()
+
+	def reset(self):
+		self.pink.reset()
+		self.count = 0
+		## start and end (in samples) of the current burst per channel
+		self.burst = np.zeros((self.nchannels, 2), dtype=np.int64)
+
+	def envelope(self, n):
+		""" Burst envelope (nchannels, n) of the next n samples.
+		"""
+		k = self.count + np.arange(n)
+		env = np.zeros((self.nchannels, n))
+		length = max(int(self.burst_length*self.fs), 1)
+		for c in range(self.nchannels):
+			while True:
+				start, end = self.burst[c]
+				inside = (k >= start) & (k < end)
+				env[c, inside] = 0.5 - 0.5*np.cos(2*np.pi*(k[inside]-start)/length)
+				if end >= k[-1] + 1:
+					break
+				## the next burst starts an exponential waiting time after this one
+				start = max(end, self.count) + int(self.rng.exponential(self.fs/self.burst_rate))
+				self.burst[c] = start, start + length
+		return env
+
+	def generate(self, n):
+		""" Returns the next n samples of all channels as uint16
+			array (nchannels, n).
+		"""
+		white = self.rng.standard_normal((self.nchannels, n))
+		## the filtered white noise has a std of about 0.09
+		x = self.pink(white) * self.noise / 0.09
+		t = (self.count + np.arange(n))/self.fs
+		alpha = np.reshape(self.alpha, (-1, 1))
+		x += alpha * self.envelope(n) * np.sin(2*np.pi*self.alpha_freq*t)
+		self.count += n
+		return np.clip(np.round(x + self.offset), 0, 2**14-1).astype(np.uint16)
+
+	def frames(self, n):
+		""" Next n samples of all channels, encoded like the
+			arduino output. Channels are interleaved sample by
+			sample.
+		"""
+		return encode_output(self.generate(n).T.ravel())
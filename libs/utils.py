@@ -1,18 +1,94 @@
 from __future__ import print_function
-import random, time
+import random, threading, time
 import Queue
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
 
 class Timer(object):
-    def __init__(self, name=None):
+    """ Context manager measuring the wall time of its block.
+        The time is printed, or, if stats (a StageTimes) is
+        given, recorded there as stage name.
+    """
+    def __init__(self, name=None, stats=None):
         self.name = name
+        self.stats = stats
     
     def __enter__(self):
         self.tstart = time.time()
+        return self
         
     def __exit__(self, type, value, traceback):
+        elapsed = time.time() - self.tstart
+        if self.stats is not None:
+            self.stats.record(self.name, elapsed)
+            return
         if self.name:
             print('[%s]' % self.name, end=' ')
-        print('Elapsed: %s' % (time.time() - self.tstart))
+        print('Elapsed: %s' % elapsed)
+
+
+class NullTimer(object):
+    """ Timer doing nothing, used by disabled StageTimes.
+    """
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, type, value, traceback):
+        pass
+
+null_timer = NullTimer()
+
+
+class StageTimes(object):
+    """ Rolling record of the durations of named processing
+        stages, e.g.
+        
+            with stats.timer('decode'):
+                ...
+        
+        The last maxlen durations of each stage are kept. When
+        disabled, timer() returns a shared timer doing nothing.
+        Stages may be recorded and read from different threads.
+    """
+    def __init__(self, enabled=True, maxlen=1000):
+        self.enabled = enabled
+        self.maxlen = maxlen
+        self.times = {}
+        self.lock = threading.Lock()
+    
+    def timer(self, name):
+        if not self.enabled:
+            return null_timer
+        return Timer(name, self)
+    
+    def record(self, name, elapsed):
+        with self.lock:
+            if name not in self.times:
+                self.times[name] = RingBuffer(self.maxlen)
+            self.times[name].append(elapsed)
+    
+    def percentiles(self, q=(50, 95, 99)):
+        """ Dict stage -> dict 'p50' etc. -> duration in s.
+        """
+        ## copy the windows, the percentiles are computed outside the lock
+        with self.lock:
+            windows = [(name, np.array(times.latest())) for name, times in self.times.items()]
+        result = {}
+        for name, times in windows:
+            values = np.percentile(times, q) if len(times) else [np.nan]*len(q)
+            result[name] = dict(('p%g' % p, float(value)) for p, value in zip(q, values))
+        return result
+    
+    def summary(self):
+        """ One line with the percentiles of all stages in ms.
+        """
+        return ', '.join('%s %.2f/%.2f/%.2f' % (name, 1e3*p['p50'], 1e3*p['p95'], 1e3*p['p99'])
+                         for name, p in sorted(self.percentiles().items()))
+    
+    def clear(self):
+        with self.lock:
+            self.times = {}
 
 
 def get_all_from_queue(Q):
@@ -0,0 +1,141 @@
+import threading, time
+from PyQt4.QtCore import QThread, pyqtSignal
+
+from libs.utils import StageTimes
+from libs.channel import ChannelManager
+from libs.game import BallGame
+
+
+class ProcessingWorker(QThread):
+	""" A thread running the processing chain of all channels and
+		the game physics, so the GUI thread only has to draw.
+
+		The worker sleeps until a ComMonitorThread sets data_ready,
+		then processes everything waiting in the queues of all
+		channels of manager (a ChannelManager). At most every
+		interval seconds, and only if new data arrived, it emits
+		frame_ready with the dict returned by ChannelManager.frame
+		and additionally:
+
+		ball:
+			(x, y) position of the ball, None if it did not move.
+
+		winner:
+			Index of the winning player after a goal, else None.
+
+		status:
+			Dict with the largest number of chunks found waiting
+			in a queue (queue_depth), the decoded samples per
+			second of all channels (sample_rate) and the time
+			since the previous frame (frame_time, in s).
+
+		With stats (a StageTimes), the duration of update_game is
+		recorded as stage 'game'.
+
+		The signal is delivered to the GUI thread as a queued
+		signal. The ball is moved by game (a BallGame) on its fixed
+		timestep of signal time, so the game speed does not depend
+		on the frame rate. Subclasses compute the drive of the ball
+		from the frame in update_game and pass it to advance_game.
+		update_game runs with game_lock held, which reset_ball and
+		playing (called from the GUI thread) take as well, so the
+		game is never changed in the middle of a step.
+	"""
+	frame_ready = pyqtSignal(object)
+
+	def __init__(self, manager, interval=0.1, parent=None, stats=None, game=None):
+		QThread.__init__(self, parent)
+		self.manager = manager
+		self.interval = interval
+		self.stats = stats if stats is not None else StageTimes(enabled=False)
+		self.game = game if game is not None else BallGame(dt=interval)
+		self.game_lock = threading.Lock()
+		self.data_ready = threading.Event()
+		self.alive = threading.Event()
+		self.tframe = 0.
+		self.nchunks = 0
+		self.nsamples = 0
+		self.queue_depth = 0
+		self.reset_ball()
+
+	def reset_ball(self):
+		with self.game_lock:
+			self.game.reset()
+
+	@property
+	def playing(self):
+		with self.game_lock:
+			return bool(self.game.playing.any())
+
+	@playing.setter
+	def playing(self, playing):
+		with self.game_lock:
+			self.game.playing[...] = playing
+
+	def run(self):
+		self.alive.set()
+		self.tframe = time.time()
+		self.nsamples = self.manager.nsamples.sum()
+		while self.alive.isSet():
+			## sleeps until data arrives (or stop), only a pending
+			## frame limits the wait to the time it is due
+			self.data_ready.wait(self.frame_due() if self.nchunks else None)
+			self.data_ready.clear()
+			frame = self.step()
+			if frame is not None:
+				self.frame_ready.emit(frame)
+
+	def stop(self):
+		self.alive.clear()
+		self.data_ready.set()
+		self.wait()
+
+	def frame_due(self):
+		""" Seconds until the next frame is due.
+		"""
+		return max(self.tframe + self.interval - time.time(), 0.)
+
+	def step(self):
+		""" Process all waiting data, returns a frame if one is
+			due, else None.
+		"""
+		nchunks = self.manager.read()
+		self.queue_depth = max(self.queue_depth, self.manager.queue_depth)
+		if nchunks > 0:
+			self.manager.process()
+			self.nchunks += nchunks
+		tframe = time.time()
+		if self.nchunks == 0 or tframe-self.tframe < self.interval:
+			return None
+		nsamples = self.manager.nsamples.sum()
+		status = dict(queue_depth=self.queue_depth, frame_time=tframe-self.tframe,
+					sample_rate=(nsamples-self.nsamples)/(tframe-self.tframe))
+		self.tframe = tframe
+		self.nchunks = 0
+		self.nsamples = nsamples
+		self.queue_depth = 0
+		frame = self.manager.frame()
+		frame.update(ball=None, winner=None, status=status)
+		with self.game_lock, self.stats.timer('game'):
+			self.update_game(frame)
+		return frame
+
+	def update_game(self, frame):
+		""" Move the ball according to the new frame, set ball
+			and winner of frame.
+		"""
+		self.advance_game(frame, None)
+
+	def advance_game(self, frame, drive):
+		""" Run the game steps up to the time of frame with drive
+			(None to keep the previous one), set ball and winner of
+			frame.
+		"""
+		if frame['time'] is None:
+			return
+		ended = self.game.advance(frame['time'], drive)
+		if self.game.playing.any() or ended.any():
+			x, y = self.game.ball
+			frame['ball'] = (float(x), float(y))
+		if ended.any():
+			frame['winner'] = int(self.game.winner)
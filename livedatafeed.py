@@ -1,3 +1,6 @@
+from libs.ringbuffer import RingBuffer
+from libs.utils import StageTimes
+
 class LiveDataFeed(object):
 	""" A simple "live data feed" abstraction that allows a reader 
 		to read the most recent data and find out whether it was 
@@ -8,19 +11,51 @@ class LiveDataFeed(object):
 		add_data(data):
 			Add new data to the feed.
 		
+		append_data(data)/extend_data(data):
+			Add one (timestamp, value) pair or arrays of them to
+			the ring buffers holding the last maxlen values.
+		
 		Interface to reader:
 		
 		read_data():
 			Returns the most recent data.
+		
+		read_arrays(n=None):
+			Returns views (timestamps, values) of the latest n
+			values, valid until the next append. Values may have
+			leading axes given by shape (e.g. (nchannels,)),
+			sharing the timestamps.
+		
+		read_filtered(n=None):
+			Same as read_arrays, but the values are resampled onto
+			a uniform time grid by resampler (if given) and then
+			passed through filter, whose coefficients assume that
+			grid (without resampler, uniformly sampled values).
+			Only values added since the last call are
+			processed, the results are kept in a second pair of
+			ring buffers. nnew tells how many of the returned
+			values are new. With stats (a StageTimes), the
+			durations of the 'filter' and 'resample' stages are
+			recorded.
 			
 		has_new_data:
 			A boolean attribute telling the reader whether the
 			data was updated since the last read.    
 	"""
-	def __init__(self):
+	def __init__(self, maxlen=1000, filter=None, resampler=None, stats=None, shape=()):
+		self.maxlen = maxlen
+		self.shape = tuple(shape)
+		self.filter = filter
+		self.resampler = resampler
+		self.stats = stats if stats is not None else StageTimes(enabled=False)
 		self.cur_data = None
 		self.has_new_data = False
-		self.list_data = []
+		self.timestamps = RingBuffer(maxlen)
+		self.values = RingBuffer(maxlen, self.shape)
+		self.filtered_t = RingBuffer(maxlen)
+		self.filtered = RingBuffer(maxlen, self.shape)
+		self.nfiltered = 0
+		self.nnew = 0
 		self.updated_list = False
 	
 	def add_data(self, data):
@@ -32,15 +67,49 @@ class LiveDataFeed(object):
 		return self.cur_data
 	   
 	def append_data(self, data):
-		self.list_data.append((data['timestamp'], data['temperature']))
-		if len(self.list_data)>1000:
-			#self.list_data = self.list_data[-1000:]
-			self.list_data.pop(0)
+		self.timestamps.append(data['timestamp'])
+		self.values.append(data['temperature'])
+		self.updated_list = True
+	
+	def extend_data(self, data):
+		self.timestamps.extend(data['timestamp'])
+		self.values.extend(data['temperature'])
 		self.updated_list = True
 		
-	def read_list(self):
+	def read_arrays(self, n=None):
+		self.updated_list = False
+		return self.timestamps.latest(n), self.values.latest(n)
+	
+	def read_filtered(self, n=None):
+		nnew = min(self.values.total - self.nfiltered, self.maxlen)
+		self.nfiltered = self.values.total
+		self.nnew = 0
+		if nnew > 0:
+			t, y = self.timestamps.latest(nnew), self.values.latest(nnew)
+			if self.resampler is not None:
+				with self.stats.timer('resample'):
+					t, y = self.resampler(t, y)
+			if self.filter is not None:
+				with self.stats.timer('filter'):
+					y = self.filter(y)
+			self.filtered_t.extend(t)
+			self.filtered.extend(y)
+			self.nnew = min(y.shape[-1], len(self.filtered))
+		self.updated_list = False
+		return self.filtered_t.latest(n), self.filtered.latest(n)
+	
+	def clear(self):
+		self.timestamps.clear()
+		self.values.clear()
+		self.filtered_t.clear()
+		self.filtered.clear()
+		self.nfiltered = 0
+		self.nnew = 0
+		if self.filter is not None:
+			self.filter.reset()
+		if self.resampler is not None:
+			self.resampler.reset()
 		self.updated_list = False
-		return self.list_data
 
 
 if __name__ == "__main__":
@@ -6,26 +6,46 @@ serial port. The packages are decoded such that the first byte
 contains the 3 most significant bits and the second byte contains
 the 7 least significat bits.
 """
-import random, sys
+import argparse, os, random, sys, time
 import numpy as np
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 import pyqtgraph as pg
-import Queue
 
 from com_monitor import ComMonitorThread
-from libs.utils import get_all_from_queue, get_item_from_queue
-from libs.decode import decode_output
-from libs.read_audio import play_sound
+from libs.utils import StageTimes
+from libs.audio import AudioEngine
 from livedatafeed import LiveDataFeed
-
-from scipy.interpolate import interp1d
-from scipy.signal import butter, lfilter
+from libs.filters import StreamingFilter, FilterBank, signal_sos, eeg_bands
+from libs.spectrum import SpectralEngine, RecursiveSpectrum, default_bands
+from libs.spectrogram import SpectrogramView
+from libs.channel import ChannelManager
+from libs.worker import ProcessingWorker
+from libs.game import BallGame
+from libs.recorder import SessionRecorder
+from libs.replay import ReplayThread
 
 
 color1 = "limegreen"
 width_signal = 5
 time_axis_range = 2 ## in s
+update_freq_plot = 10. ## Hz
+
+## acquisition parameters
+baud_rate = 230400
+ports = ['/dev/ttyACM0']
+sample_rate = 10000 ## Hz, sent to the arduino
+channels_per_port = 1 ## electrodes per arduino, sent to the arduino
+full_rate = False ## decode every sample instead of one average per chunk
+resample_rate = 1000. ## Hz, uniform grid for the averaged samples
+record_path = None ## directory for raw recordings of each session, None disables recording
+profile = False ## record the duration of each processing stage, shown in the status bar
+spectrogram_time = 30 ## s of history shown in the spectrogram
+signal_cutoff = 170. ## Hz, lowpass of the displayed signal
+mains_freq = 50. ## Hz, notched out of the signal and the bands
+band_power_mode = 'fft' ## or 'recursive': spectrum and band powers follow the signal within about band_power_tau
+band_power_tau = 0.1 ## s, time constant of the recursive band powers
+game_seed = None ## seed of the random ball movement, e.g. 0 to repeat a game
 
 pg.setConfigOption('background', 'w')
 pg.setConfigOption('foreground', 'k')
@@ -35,15 +55,50 @@ sound_path = '/home/bettina/physics/arduino/eeg_mindball/sound/'
 sound_files = ['End_of_football_game','Football-crowd-GOAL','intro_brass_01','Jingle_Win_00','Jingle_Win_01']
 ambience_sound = sound_path + 'Norwegian_football_matchsoccer_game_ambience.wav'
 
+class MindballWorker(ProcessingWorker):
+	""" Processing worker for the single player game: the
+		averaged alpha power pushes the ball towards the goal.
+	"""
+	def __init__(self, manager, tuning_factor, interval, stats=None, seed=None):
+		game = BallGame(nplayers=1, tuning_factor=tuning_factor, dt=interval, seed=seed, noise=0., damping=0.4)
+		ProcessingWorker.__init__(self, manager, interval, stats=stats, game=game)
+		self.fft1_norm = np.zeros(manager.spectral.nfreq)
+	
+	def update_game(self, frame):
+		if frame['spectrum'] is not None:
+			## average over the electrodes of the player
+			fft1 = self.manager.per_source(frame['spectrum'])[0].mean(axis=0)
+			fft1[0] = 0
+			self.fft1_norm += fft1/np.sum(fft1)		#single items not well weighted
+			self.fft1_norm = self.fft1_norm/np.sum(self.fft1_norm)
+			frame['spectrum'][0] = self.fft1_norm
+		
+		power_alpha = None
+		if self.fft1_norm.any():
+			power_alpha = np.sum(self.fft1_norm[self.manager.spectral.band_slices['game']])
+		self.advance_game(frame, power_alpha)
+
+
 class PlottingDataMonitor(QMainWindow):
-	def __init__(self, parent=None):
+	def __init__(self, parent=None, ports=ports, baud=baud_rate, replay_files=None, realtime=True, chunk_size=None, profile=profile,
+			channels_per_port=channels_per_port):
 		super(PlottingDataMonitor, self).__init__(parent)
 		
+		## data sources: serial ports or recorded sessions
+		self.ports = ports
+		self.baud = baud
+		self.replay_files = replay_files
+		self.realtime = realtime
+		self.chunk_size = chunk_size
+		self.stats = StageTimes(enabled=profile)
+		self.channels_per_port = channels_per_port
+		
 		self.monitor_active = False
-		self.com_monitor = None
-		self.livefeed = LiveDataFeed()
-		self.temperature_samples = []
-		self.timer = QTimer()
+		self.source_error = None
+		nchannels = len(replay_files or ports)*channels_per_port
+		rate = sample_rate if full_rate else resample_rate
+		feed = LiveDataFeed(time_axis_range*sample_rate if full_rate else 1000,
+			stats=self.stats, shape=(nchannels,))
 		
 		self.create_menu()
 		self.yaxis_low,self.yaxis_high = 400,600#0,1000
@@ -54,20 +109,43 @@ class PlottingDataMonitor(QMainWindow):
 		self.x_low = 4
 		self.x_high = 13
 		self.frequency = 1 ##Hz
-		self.nmax = 1000
-		self.fft1_norm = np.zeros((self.nmax//2))
-		self.b, self.a = butter(3, [0.0, 0.34], btype='band')
+		self.nmax = feed.maxlen
+		noverlap = self.nmax*9//10
+		welch = SpectralEngine(rate, self.nmax, noverlap, nseg=1,
+			bands=dict(default_bands, game=(self.x_low,self.x_high)), magnitude=True,
+			shape=(nchannels,), history=int(spectrogram_time*rate)//(self.nmax-noverlap))
+		self.spectrogram = SpectrogramView(welch.history.capacity, welch.freqs, welch.hop/welch.fs,
+			magnitude=True)
+		self.plot_layout.addWidget(self.spectrogram)
+		feed.filter = StreamingFilter(sos=signal_sos(rate, signal_cutoff, mains_freq))
+		## band power envelopes, available with every block
+		bank = FilterBank(rate, dict(eeg_bands, game=(self.x_low,self.x_high)), mains=mains_freq,
+			shape=(nchannels,))
+		estimator = None
+		if band_power_mode == 'recursive':
+			estimator = RecursiveSpectrum(rate, self.nmax, band_power_tau,
+				bands=dict(default_bands, game=(self.x_low,self.x_high)), magnitude=True,
+				shape=(nchannels,), fmax=signal_cutoff)
+		self.manager = ChannelManager(len(replay_files or ports), feed, welch, rate, full_rate,
+			sample_rate, channels_per_port, stats=self.stats, bank=bank, estimator=estimator)
 		
 		## init arena stuff
-		self.ball_coordx = 0.
-		self.ball_coordy = 0.
 		self.tuning_factor = 0.1
 		self.text_html = '<div style="text-align: center"><span style="color: #FFF; font-size: 30pt">Goal</span><br><span style="color: #FFF; font-size: 30pt; text-align: center"> {} is winner </span></div>'
 		self.show_one_item = False
 		self.winner_text = None
-		self.playing = False
 		self.win_hymn_no = 2
 		
+		## sounds are decoded once and mixed in the background
+		self.audio = AudioEngine()
+		for name in sound_files:
+			self.audio.load(name, sound_path + name + '.wav')
+		self.audio.load('ambience', ambience_sound)
+		self.ambience = None
+		
+		## decoding, dsp and ball physics run in the worker thread
+		self.worker = MindballWorker(self.manager, self.tuning_factor, 1./update_freq_plot, self.stats, game_seed)
+		self.worker.frame_ready.connect(self.on_frame)
 	
 	def create_plot(self, xlabel, ylabel, xlim, ylim, ncurves=1):
 		plot = pg.PlotWidget()
@@ -152,7 +230,7 @@ class PlottingDataMonitor(QMainWindow):
 		self.plot, self.curve = self.create_plot('Time', 'Signal', [0,5], [self.yaxis_low,self.yaxis_high])
 		self.plot_fft, self.curve_fft = self.create_plot('Frequency', 'FFt', [0,60], [0,.01])
 
-		plot_layout = QVBoxLayout()
+		self.plot_layout = plot_layout = QVBoxLayout()
 		plot_layout.addWidget(self.plot)
 		plot_layout.addWidget(self.plot_fft)
 		
@@ -229,12 +307,15 @@ class PlottingDataMonitor(QMainWindow):
 	def on_stop(self):
 		""" Stop the monitor
 		"""
-		if self.com_monitor is not None:
-			self.com_monitor.join(0.01)
-			self.com_monitor = None
-
+		self.worker.stop()
+		if self.stats.enabled:
+			print('[stats] p50/p95/p99 ms: ' + self.stats.summary())
+		self.manager.stop()
+		## fades out under the winner jingle
+		self.audio.stop(self.ambience, fade=2.)
+		self.ambience = None
+		
 		self.monitor_active = False
-		self.timer.stop()
 		self.set_actions_enable_state()
 		
 		self.status_text.setText('Monitor idle')
@@ -245,183 +326,130 @@ class PlottingDataMonitor(QMainWindow):
 		self.plot_arena.removeItem(self.winner_text)
 		self.show_one_item = False
 		
-		self.ball_coordx, self.ball_coordy = 0,0
-		self.curve_arena.setData([self.ball_coordx], [self.ball_coordy])
+		self.worker.reset_ball()
+		self.curve_arena.setData([0], [0])
 	
 	def reset_signal(self):
 		""" empty list of signal values"""
-		self.livefeed.updated_list = False
-		self.livefeed.list_data = []
+		self.manager.reset()
 		self.curve.setData([], [])
 		self.curve_fft.setData([], [])
+		self.spectrogram.clear_columns()
 		self.plot.replot()
 		
 	
 	def on_start(self):
-		""" Start the monitor: com_monitor thread and the update
-			timer
+		""" Start the monitor: com_monitor thread and the 
+			processing worker
 		"""
-		if self.com_monitor is not None:
+		if self.monitor_active:
 			return
 		
 		if self.show_one_item is True:
 			self.reset_arena()
 			self.reset_signal()
 		
-		self.data_q = Queue.Queue()
-		self.error_q = Queue.Queue()
-		self.com_monitor = ComMonitorThread(
-			self.data_q,
-			self.error_q,
-			'/dev/ttyACM0',
-			230400)
-			#115200)
-		self.com_monitor.start()
-		
-		com_error = get_item_from_queue(self.error_q)
-		if com_error is not None:
+		self.source_error = None
+		## one timestamp for the recordings of all ports of a session
+		self.session_name = time.strftime('%Y%m%d-%H%M%S')
+		for com_error in self.manager.start(self.create_source):
 			QMessageBox.critical(self, 'ComMonitorThread error',
 				com_error)
-			self.com_monitor = None
 
 		self.monitor_active = True
 		self.set_actions_enable_state()
 		
-		self.timer = QTimer()
-		self.connect(self.timer, SIGNAL('timeout()'), self.on_timer)
-		update_freq = 1000. #Hz
-		
-		self.timer_plot = QTimer()
-		self.connect(self.timer_plot, SIGNAL('timeout()'), self.on_timer_plot)
-		update_freq_plot = 10. #Hz
-		
-		self.timer.start(1000.0 / update_freq) #ms
-		self.timer_plot.start(1000.0 / update_freq_plot) #ms
+		self.stats.clear()
+		self.worker.start()
+		if not self.audio.playing(self.ambience):
+			self.ambience = self.audio.play('ambience', volume=0.5, loop=True)
 		
 		self.status_text.setText('Monitor running')
-		
-	def on_timer(self):
-		""" Executed periodically when the monitor update timer
-			is fired.
+	
+	def create_source(self, i, data_q, error_q):
+		""" Thread filling data_q for player i: a ComMonitorThread
+			reading ports[i] or a ReplayThread replaying
+			replay_files[i].
 		"""
-		self.read_serial_data()
-		if self.livefeed.has_new_data:
-			self.livefeed.append_data(self.livefeed.read_data())
-			#self.livefeed.append_data_array(self.livefeed.read_data())
+		if self.replay_files:
+			return ReplayThread(data_q, error_q, self.replay_files[i],
+				realtime=self.realtime, chunk_size=self.chunk_size,
+				data_ready=self.worker.data_ready)
+		return ComMonitorThread(
+			data_q,
+			error_q,
+			self.ports[i],
+			self.baud,
+			sample_rate=sample_rate,
+			nchannels=self.channels_per_port,
+			data_ready=self.worker.data_ready,
+			recorder=self.create_recorder(self.session_name, os.path.basename(self.ports[i]), error_q))
 	
-	def on_timer_plot(self):
-		""" Executed periodically when the plot update timer
-			is fired.
+	def create_recorder(self, session, name, error_q):
+		""" Recorder for the raw data of port name in session,
+			None if recording is disabled. Its errors go to error_q.
 		"""
-		self.update_monitor()
+		if record_path is None:
+			return None
+		filename = session + '_' + name + '.rec'
+		return SessionRecorder(os.path.join(record_path, filename), error_q=error_q)
 	
 	def on_arena(self):
-		self.playing = True
-		self.ball_coordx, self.ball_coordy = 0,0
-		self.curve_arena.setData([self.ball_coordx], [self.ball_coordy])
+		self.worker.reset_ball()
+		self.worker.playing = True
+		self.curve_arena.setData([0], [0])
 		print('Game is starting.')
 	
 	def tile_windows(self):
 		self.mdi.tileSubWindows()
 	
-	def update_monitor(self):
-		""" Updates the state of the monitor window with new 
-			data. The livefeed is used to find out whether new
-			data was received since the last update. If not, 
-			nothing is updated.
+	def on_frame(self, frame):
+		""" Shows a frame of processed data sent by the worker.
 		"""
-		update1 = False
-		if self.livefeed.updated_list:
-			self.temperature_samples = self.livefeed.read_list()
-			
-			xdata = [s[0] for s in self.temperature_samples]
-			ydata = [s[1] for s in self.temperature_samples]
-			
-			## interpolate signal
-			n = len(ydata)
-			f = interp1d(xdata, ydata)# alternative (slow) choice: kind='cubic'
-			xdata = np.linspace(xdata[0],xdata[-1],n)
-			ydata = f(xdata)
-
-			## bandpass filter signal
-			ydata = lfilter(self.b, self.a, ydata)
-			
+		self.show_status(frame['status'])
+		with self.stats.timer('draw'):
+			self.draw_frame(frame)
+	
+	def show_status(self, status):
+		text = 'Monitor running: queue %d, %.0f samples/s, frame %.0f ms' % (
+			status['queue_depth'], status['sample_rate'], 1e3*status['frame_time'])
+		if self.stats.enabled:
+			text += ' | p50/p95/p99 ms: ' + self.stats.summary()
+		## e.g. a recorder failing after the start
+		for error in self.manager.errors():
+			self.source_error = error
+		if self.source_error is not None:
+			text += ' | ' + self.source_error
+		self.status_text.setText(text)
+	
+	def draw_frame(self, frame):
+		xdata, ydata = frame['x'], frame['y'][0]
+		## next frames are decimated to the pixel width of the plot
+		self.manager.render_points = 2*self.plot.width()
+		if len(ydata) > 0:
 			self.plot.setXRange(max(0,xdata[-1]-time_axis_range), max(time_axis_range, xdata[-1]))
 			self.curve.setData(xdata, ydata, _CallSync='off')
+		
+		if frame['spectrum'] is not None:
+			self.curve_fft.setData(frame['freqs'][1:],frame['spectrum'][0][1:])
+		
+		if frame['columns'] is not None:
+			self.spectrogram.update_columns(self.manager.per_source(frame['columns'])[0].mean(axis=0))
+		
+		if frame['ball'] is not None:
+			self.curve_arena.setData([frame['ball'][0]], [frame['ball'][1]], _CallSync='off')
+		
+		if (frame['winner'] is not None and self.show_one_item is False):
+			winner_color = color1
+			self.winner_text = pg.TextItem(html=self.text_html.format(winner_color), anchor=(0.5,2.3),\
+			border=QColor(winner_color), fill=(201, 165, 255, 100))
 			
-			# plot fft of port 1
-			#
-			if n>=(self.nmax):
-				delta = xdata[1]-xdata[0]
-				yfft = np.fft.rfft(ydata)
-				x = np.fft.rfftfreq(n,d=delta)
-				fft1 = np.abs(yfft)
-				self.fft1_norm += fft1[1:]/np.sum(fft1[1:])		#single items not well weighted
-				self.fft1_norm = self.fft1_norm/np.sum(self.fft1_norm)
-			
-				self.curve_fft.setData(x[1:],self.fft1_norm)
-				
-			if (self.playing and n>=(self.nmax)):
-				ind_alpha = (x[1:]>self.x_low)*(x[1:]<self.x_high)
-				power_alpha = np.sum(self.fft1_norm[ind_alpha])
-			
-				self.ball_coordx += (power_alpha)*self.tuning_factor
-				#self.ball_coordy += np.random.normal(scale=0.05)
-
-				self.curve_arena.setData([np.sign(self.ball_coordx)*min(1, abs(self.ball_coordx))], [self.ball_coordy], _CallSync='off')
-
-				if abs(self.ball_coordy)>(0.7*(1.1-abs(self.ball_coordx))):
-					self.ball_coordy = self.ball_coordy*0.6
-				if (abs(self.ball_coordx)>1 and self.show_one_item is False):
-					winner_color = color1
-					self.winner_text = pg.TextItem(html=self.text_html.format(winner_color), anchor=(0.5,2.3),\
-					border=QColor(winner_color), fill=(201, 165, 255, 100))
-					
-					self.plot_arena.addItem(self.winner_text)
-					self.show_one_item = True
-					self.playing = False
-					self.on_stop()
-					self.win_hymn_no = 4#np.random.randint(len(sound_files))
-					play_sound(sound_path + sound_files[self.win_hymn_no] + '.wav')
-					
+			self.plot_arena.addItem(self.winner_text)
+			self.show_one_item = True
+			self.on_stop()
+			self.win_hymn_no = 4#np.random.randint(len(sound_files))
+			self.audio.play(sound_files[self.win_hymn_no])
 	
-	def read_serial_data(self):
-		""" Called periodically by the update timer to read data
-			from the serial port.
-		"""
-		qdata = list(get_all_from_queue(self.data_q))
-		if len(qdata) > 0:
-			output = decode_output(qdata[-1][0])
-			data = dict(timestamp=qdata[-1][1], 
-						temperature=float(np.nanmean(output)))
-			self.livefeed.add_data(data)
-			
-		## dont average over signal but plot every bit, assume sample rate of 10kHz 
-		#
-		#qdata = list(get_all_from_queue(self.data_q))
-		#if len(qdata) > 0:
-			#output = decode_output(qdata[-1][0])
-			#tstamp = qdata[-1][1]
-			#tstamps = np.linspace(tstamp-len(output)*10**(-5),tstamp,len(output))
-			#data = dict(timestamp=tstamps, 
-						#temperature= np.array([float(item) for item in output]) )
-			#self.livefeed.add_data(data)
-		
-		
-		#qdata = list(get_item_from_queue(self.data_q))
-		#tstamp = qdata[1]
-		#output = decode_output(qdata[0])
-		#if len(output) > 0:
-			#data = dict(timestamp=tstamp, 
-						#temperature=float(np.nanmean(output)))#
-			#self.livefeed.add_data(data)
-		
-		#if len(output) > 0:
-			#tstamps = np.linspace(tstamp-len(output)*10**(-5),tstamp,len(output))
-			#data = dict(timestamp=tstamps, 
-						#temperature= np.array([float(item) for item in output]) )
-			#self.livefeed.add_data(data)
-			
 	# The following two methods are utilities for simpler creation
 	# and assignment of actions
 	#
@@ -451,10 +479,30 @@ class PlottingDataMonitor(QMainWindow):
 
 
 def main():
-	app = QApplication(sys.argv)
-	form = PlottingDataMonitor()
-	form.show()	
+	parser = argparse.ArgumentParser(description='EEG mind ball monitor')
+	parser.add_argument('--port', nargs=1, default=ports,
+		help='serial ports of the arduinos')
+	parser.add_argument('--baud', type=int, default=baud_rate,
+		help='baud rate of the serial ports')
+	parser.add_argument('--replay', nargs=1, metavar='FILE',
+		help='replay recorded sessions instead of reading the serial ports')
+	parser.add_argument('--fast', action='store_true',
+		help='replay as fast as possible instead of in real time')
+	parser.add_argument('--chunk-size', type=int,
+		help='replay chunks of this many bytes')
+	parser.add_argument('--channels', type=int, default=channels_per_port,
+		help='electrodes per arduino')
+	parser.add_argument('--profile', action='store_true', default=profile,
+		help='show the duration of each processing stage')
+	args, qt_args = parser.parse_known_args()
+	
+	app = QApplication(sys.argv[:1] + qt_args)
+	form = PlottingDataMonitor(ports=args.port, baud=args.baud, replay_files=args.replay,
+		realtime=not args.fast, chunk_size=args.chunk_size, profile=args.profile,
+		channels_per_port=args.channels)
+	form.show()
 	app.exec_()
+	form.audio.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+"""
+Parameter sweep of the mind ball game over recorded sessions.
+
+The spectra of the recorded sessions (.rec files, grouped into
+sessions like in analyze_sessions) are computed once, in a pool of
+processes. From them, the drive of the ball (see analyze_sessions)
+is derived for every combination of the game band limits (--low,
+--high, in Hz, x_low/x_high of the monitors) at once, as an array
+with one axis per band limit. The games for all tuning factors
+(--tuning-factor, log spaced) run side by side in one BallGame whose
+state has one axis per parameter, (tuning factor, low, high). After
+a goal, the ball is put back to the center and the next game starts.
+
+For every combination, over all sessions with the same number of
+players (--players):
+
+duration:
+	Mean duration of a game in s (played time per goal).
+
+target:
+	Fraction of the games lasting --target min to max s.
+
+balance:
+	Two players: abs(fraction of the goals won by player 2 - 0.5)*2,
+	0 for a fair game, 1 if one player always wins.
+
+spread:
+	Coefficient of variation of the mean game duration over the
+	sessions, how much the game depends on the player.
+
+The --top best combinations (duration closest to the middle of the
+target range, balance and spread as small as possible) are printed,
+all results are written to --output as npz arrays with one axis per
+parameter.
+"""
+from __future__ import print_function
+import argparse, multiprocessing, sys, time
+import numpy as np
+
+from analyze_sessions import find_sessions, make_manager, merged_chunks, game_settings
+from libs.game import BallGame
+
+
+def session_spectra(args):
+	""" Frame times (nframes,) and spectra (nframes, nchannels,
+		nfreq) of a recorded session, computed like in the monitors.
+	"""
+	name, paths, interval, channels_per_source, full_rate = args
+	manager = make_manager(len(paths), channels_per_source, full_rate)
+	t, spectra = [], []
+	tframe = None
+	for timestamp, i, data in merged_chunks(paths):
+		if tframe is None:
+			tframe = timestamp
+		manager.data_qs[i].put((data, timestamp))
+		if timestamp - tframe < interval:
+			continue
+		tframe = timestamp
+		if manager.read() > 0:
+			manager.process()
+		frame = manager.frame()
+		if frame['spectrum'] is not None:
+			t.append(frame['time'])
+			spectra.append(frame['spectrum'].astype(np.float32))
+	return dict(name=name, nsources=len(paths), channels_per_source=channels_per_source,
+		freqs=manager.welch.freqs, t=np.array(t),
+		spectra=np.reshape(spectra, (len(t), manager.nchannels, manager.welch.nfreq)))
+
+
+def band_sums(spectra, freqs, lows, highs):
+	""" Sums of spectra (..., nfreq) over the bands low < f < high
+		for all combinations, shape (..., nlow, nhigh). Bands with
+		low >= high are empty.
+	"""
+	cumsum = np.concatenate((np.zeros(spectra.shape[:-1] + (1,)), np.cumsum(spectra, axis=-1)), axis=-1)
+	first = np.searchsorted(freqs, lows, 'right')
+	last = np.maximum(np.searchsorted(freqs, highs, 'left')[None, :], first[:, None])
+	return cumsum[..., last] - cumsum[..., first][..., None]
+
+
+def session_drive(session, lows, highs):
+	""" Drive of the ball at the frames of session, (nframes,
+		nlow, nhigh).
+	"""
+	spectra = session['spectra'].astype(float)
+	nframes, cps = len(spectra), session['channels_per_source']
+	per_source = spectra.reshape((nframes, session['nsources'], cps, -1))
+	if session['nsources'] == 1:
+		## running normalized spectrum of the single player monitor
+		fft1 = per_source[:, 0].mean(axis=1)
+		fft1[:, 0] = 0
+		fft_norm = np.zeros_like(fft1)
+		norm = np.zeros(fft1.shape[-1])
+		for k in range(nframes):
+			norm += fft1[k]/np.sum(fft1[k])
+			norm /= np.sum(norm)
+			fft_norm[k] = norm
+		return band_sums(fft_norm, session['freqs'], lows, highs)
+	## relative band power of each electrode, averaged per player
+	total = np.sum(per_source[..., 1:], axis=-1)[..., None, None]
+	powers = (band_sums(per_source, session['freqs'], lows, highs)/total).mean(axis=2)
+	return powers[:, 1] - powers[:, 0]
+
+
+def simulate(t, drive, tuning_factors, nplayers, dt=0.1, target=(120., 180.), seed=0):
+	""" Play the games of all parameter combinations on the drive
+		of one session, restarting after every goal. Returns the
+		played time in s and counts of shape (ntuning,) +
+		drive.shape[1:]: goals, goals of player 2 (wins_right) and
+		games in the target duration range.
+	"""
+	shape = (len(tuning_factors),) + drive.shape[1:]
+	settings = dict(game_settings[nplayers])
+	settings['tuning_factor'] = np.reshape(tuning_factors, (-1,) + (1,)*(drive.ndim-1))*np.ones(shape)
+	game = BallGame(nplayers, dt=dt, seed=seed, **settings)
+	game.start()
+	nsteps = int((t[-1]-t[0])/dt + 1e-9) + 1 if len(t) else 0
+	## the latest drive before each step
+	index = np.searchsorted(t, t[0] + np.arange(nsteps)*dt, 'right') - 1 if nsteps else []
+	start = np.zeros(shape, dtype=int)
+	goals, wins_right, in_target = [np.zeros(shape, dtype=int) for i in range(3)]
+	for k, i in enumerate(index):
+		ended = game.step(drive[i])
+		if not ended.any():
+			continue
+		duration = (k+1-start)*dt
+		goals += ended
+		wins_right += ended & (game.winner == 1)
+		in_target += ended & (duration >= target[0]) & (duration <= target[1])
+		start[ended] = k+1
+		game.restart(ended)
+	return nsteps*dt, dict(goals=goals, wins_right=wins_right, in_target=in_target)
+
+
+def sweep(sessions, tuning_factors, lows, highs, dt=0.1, target=(120., 180.), seed=0):
+	""" Metrics (dict name -> array (ntuning, nlow, nhigh)) of all
+		combinations over the given sessions (spectra of
+		session_spectra, all with the same number of players).
+	"""
+	nplayers = min(sessions[0]['nsources'], 2)
+	shape = (len(tuning_factors), len(lows), len(highs))
+	goals, wins_right, in_target = [np.zeros(shape) for i in range(3)]
+	total_time, durations = 0., []
+	for session in sessions:
+		if len(session['t']) == 0:
+			continue
+		played, counts = simulate(session['t'], session_drive(session, lows, highs),
+			tuning_factors, nplayers, dt, target, seed)
+		total_time += played
+		goals += counts['goals']
+		wins_right += counts['wins_right']
+		in_target += counts['in_target']
+		durations.append(played/np.maximum(counts['goals'], 1e-9))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		duration = np.where(goals > 0, total_time/goals, np.inf)
+		metrics = dict(duration=duration,
+			target=np.where(goals > 0, in_target/goals, 0.),
+			balance=np.where(goals > 0, np.abs(2*wins_right/goals - 1), 1.) if nplayers > 1 else np.zeros(shape),
+			spread=np.std(durations, axis=0)/np.mean(durations, axis=0) if len(durations) > 1 else np.zeros(shape),
+			goals=goals)
+	metrics['spread'] = np.nan_to_num(metrics['spread'])
+	metrics['score'] = np.abs(np.log(metrics['duration']/np.mean(target))) + metrics['balance'] + metrics['spread']
+	return metrics
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Sweep of tuning_factor and game band over recorded sessions')
+	parser.add_argument('paths', nargs='+',
+		help='.rec files or directories of them')
+	parser.add_argument('--players', type=int, choices=(1, 2), default=2,
+		help='sweep the sessions with this many players')
+	parser.add_argument('--tuning-factor', type=float, nargs=3, metavar=('MIN', 'MAX', 'N'),
+		help='log spaced tuning factors, default around the one of the monitor')
+	parser.add_argument('--low', type=float, nargs=3, default=[2., 8., 7], metavar=('MIN', 'MAX', 'N'),
+		help='lower band limits in Hz')
+	parser.add_argument('--high', type=float, nargs=3, default=[10., 20., 11], metavar=('MIN', 'MAX', 'N'),
+		help='upper band limits in Hz')
+	parser.add_argument('--target', type=float, nargs=2, default=[120., 180.], metavar=('MIN', 'MAX'),
+		help='wanted duration of a game in s')
+	parser.add_argument('--interval', type=float, default=0.1,
+		help='time between frames and game steps in s')
+	parser.add_argument('--channels', type=int, default=1,
+		help='electrodes per arduino')
+	parser.add_argument('--full-rate', action='store_true',
+		help='decode every sample instead of one average per chunk')
+	parser.add_argument('--seed', type=int, default=0,
+		help='seed of the random steps of the ball')
+	parser.add_argument('--jobs', '-j', type=int, default=multiprocessing.cpu_count(),
+		help='number of processes computing the spectra')
+	parser.add_argument('--top', type=int, default=10,
+		help='number of best combinations printed')
+	parser.add_argument('--output', '-o', default='sweep.npz',
+		help='npz file for the parameters and metrics')
+	args = parser.parse_args()
+
+	sessions = dict((name, paths) for name, paths in find_sessions(args.paths).items()
+					if min(len(paths), 2) == args.players)
+	if not sessions:
+		print('[sweep] no recordings with %d players found' % args.players, file=sys.stderr)
+		sys.exit(1)
+	if args.tuning_factor is None:
+		tuning_factor = game_settings[args.players]['tuning_factor']
+		args.tuning_factor = [tuning_factor/10., tuning_factor*10., 41]
+	tuning_factors = np.logspace(np.log10(args.tuning_factor[0]), np.log10(args.tuning_factor[1]),
+		int(args.tuning_factor[2]))
+	lows = np.linspace(args.low[0], args.low[1], int(args.low[2]))
+	highs = np.linspace(args.high[0], args.high[1], int(args.high[2]))
+
+	tstart = time.time()
+	tasks = [(name, paths, args.interval, args.channels, args.full_rate)
+			for name, paths in sorted(sessions.items())]
+	pool = multiprocessing.Pool(min(args.jobs, len(tasks)))
+	try:
+		spectra = pool.map(session_spectra, tasks)
+	finally:
+		pool.close()
+		pool.join()
+	tspectra = time.time()
+	metrics = sweep(spectra, tuning_factors, lows, highs, args.interval, args.target, args.seed)
+	print('[sweep] %d sessions, %d combinations: spectra %.1f s, games %.1f s' % (len(spectra),
+		metrics['score'].size, tspectra-tstart, time.time()-tspectra), file=sys.stderr)
+
+	np.savez(args.output, tuning_factor=tuning_factors, low=lows, high=highs, **metrics)
+	print('tuning_factor   low  high  duration  target  balance  spread')
+	for flat in np.argsort(metrics['score'], axis=None)[:args.top]:
+		i, j, k = np.unravel_index(flat, metrics['score'].shape)
+		print('%13.4g %5.1f %5.1f %8.0fs %7.2f %8.2f %7.2f' % (tuning_factors[i], lows[j], highs[k],
+			metrics['duration'][i,j,k], metrics['target'][i,j,k],
+			metrics['balance'][i,j,k], metrics['spread'][i,j,k]))
+
+
+if __name__ == "__main__":
+	main()
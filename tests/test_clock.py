@@ -0,0 +1,41 @@
+import numpy as np
+
+from libs.clock import SampleClock, posix_monotonic
+
+
+def test_monotonic_clock():
+	clock = posix_monotonic()
+	if clock is None:
+		return
+	readings = [clock() for i in range(1000)]
+	assert np.all(np.diff(readings) >= 0)
+
+
+def arrivals(clock, rate, chunk, nchunks, t0=100., jitter=0.002, seed=0):
+	rng = np.random.RandomState(seed)
+	for i in range(nchunks):
+		clock.update(chunk, t0 + (i+1)*chunk/rate + rng.uniform(0, jitter))
+
+
+def test_fits_skew():
+	clock = SampleClock(10000)
+	arrivals(clock, 10100., 100, 2000)
+	assert abs(clock.skew - 0.01) < 1e-3
+	## sample times are uniform
+	assert np.allclose(np.diff(clock.times(1000, 100)), 1./clock.rate)
+
+
+def test_restarts_on_backward_step():
+	clock = SampleClock(10000)
+	arrivals(clock, 10000., 100, 100)
+	assert clock.nupdates == 100
+	arrivals(clock, 10000., 100, 1, t0=50.)
+	assert clock.nupdates == 1
+	assert clock.count == 10100
+
+
+def test_restarts_on_jump():
+	clock = SampleClock(10000, max_error=0.25)
+	arrivals(clock, 10000., 100, 100)
+	arrivals(clock, 10000., 100, 1, t0=102.)
+	assert clock.nupdates == 1
@@ -0,0 +1,50 @@
+import numpy as np
+
+from libs.decimate import MinMaxPyramid
+
+
+def filled(capacity=4096, n=3000, shape=(2,), block=100, seed=0):
+	pyramid = MinMaxPyramid(capacity, shape)
+	rng = np.random.RandomState(seed)
+	t = np.arange(n)/1000.
+	y = rng.standard_normal(shape + (n,))
+	for start in range(0, n, block):
+		pyramid.extend(t[start:start+block], y[..., start:start+block])
+	return pyramid, t, y
+
+
+def test_levels_match_one_shot():
+	a, t, y = filled(block=37)
+	b = MinMaxPyramid(4096, (2,))
+	b.extend(t, y)
+	for level in range(a.nlevels):
+		assert np.array_equal(a.lo[level].latest(), b.lo[level].latest())
+		assert np.array_equal(a.hi[level].latest(), b.hi[level].latest())
+
+
+def test_block_extremes():
+	pyramid, t, y = filled()
+	lo, hi = pyramid.lo[3].latest(), pyramid.hi[3].latest()
+	blocks = y[..., :len(t)//8*8].reshape((2, -1, 8))
+	assert np.array_equal(lo, blocks.min(axis=-1))
+	assert np.array_equal(hi, blocks.max(axis=-1))
+
+
+def test_render_keeps_peaks():
+	pyramid, t, y = filled()
+	y[1, 1234] = 50.
+	pyramid.clear()
+	pyramid.extend(t, y)
+	x, r = pyramid.render(400)
+	assert len(x) <= 400 and r.shape == (2, len(x))
+	assert r[1].max() == 50.
+	assert np.isclose(r.min(), y.min()) and np.isclose(r.max(), y.max())
+	## the full window without decimation when it fits
+	x, r = pyramid.render(10000)
+	assert np.array_equal(r, y)
+
+
+def test_render_duration():
+	pyramid, t, y = filled()
+	x, r = pyramid.render(10000, duration=0.5)
+	assert np.isclose(x[-1] - x[0], 0.5)
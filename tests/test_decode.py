@@ -0,0 +1,64 @@
+import numpy as np
+
+from libs.decode import decode_output, decode_output_loop, encode_output, StreamDecoder
+
+
+def samples(n, seed=0):
+	return np.random.RandomState(seed).randint(0, 2**14, n)
+
+
+def test_vectorized_matches_loop():
+	x = samples(1000)
+	for line in (encode_output(x), b'\x05\x03' + encode_output(x) + b'\x81'):
+		assert np.array_equal(decode_output(line), decode_output_loop(line))
+	assert np.array_equal(decode_output(encode_output(x)), x)
+	assert len(decode_output(b'\x05\x03')) == 0
+
+
+def test_chunk_edges():
+	x = samples(200)
+	line = encode_output(x)
+	for split in range(len(line)):
+		decoder = StreamDecoder()
+		out = np.concatenate((decoder.decode(line[:split]), decoder.decode(line[split:])))
+		assert np.array_equal(out, x)
+	assert decoder.ndropped == 0 and decoder.nresync == 0
+
+
+def test_resync_after_garbage():
+	x = samples(30)
+	decoder = StreamDecoder()
+	out = decoder.decode(b'\x01\x02' + encode_output(x[:10]))
+	out = np.concatenate((out, decoder.decode(encode_output(x[10:20]) + b'\x7f\x7f')))
+	out = np.concatenate((out, decoder.decode(b'\x7f' + encode_output(x[20:]))))
+	assert np.array_equal(out, x)
+	assert decoder.nresync == 1 and decoder.ndropped == 3
+
+
+def test_channels_across_chunks():
+	x = samples(3*100).reshape(100, 3)
+	line = encode_output(x.ravel())
+	decoder = StreamDecoder(3)
+	out = np.concatenate([decoder.decode_channels(line[i:i+7]) for i in range(0, len(line), 7)], axis=1)
+	assert np.array_equal(out, x.T)
+
+
+def test_channel_phase_reset_on_resync():
+	x = samples(2*20).reshape(20, 2)
+	decoder = StreamDecoder(2)
+	## the second channel of the fifth set is lost with broken bytes
+	broken = encode_output(x[:5].ravel()[:-1]) + b'\x01'
+	out = np.concatenate((decoder.decode_channels(broken), decoder.decode_channels(encode_output(x[5:].ravel()))),
+		axis=1)
+	assert decoder.nphase_resets == 1
+	assert np.array_equal(out, np.delete(x, 4, axis=0).T)
+
+
+def test_garbage_split_across_chunks():
+	x = samples(2*10).reshape(10, 2)
+	decoder = StreamDecoder(2)
+	first = decoder.decode_channels(encode_output(x[:3].ravel()) + encode_output([7]) + b'\x01')
+	middle = decoder.decode_channels(b'\x02')
+	last = decoder.decode_channels(encode_output(x[3:].ravel()))
+	assert decoder.nphase_resets == 1 and middle.shape == (2, 0)
+	assert np.array_equal(np.concatenate((first, last), axis=1), x.T)
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy.signal import butter
+
+from libs.filters import StreamingFilter, FilterBank, butter_sos, signal_sos
+from libs.resample import StreamingResampler
+from livedatafeed import LiveDataFeed
+
+
+def blocks(x, sizes):
+	pos = 0
+	for n in sizes:
+		yield x[..., pos:pos+n]
+		pos += n
+	yield x[..., pos:]
+
+
+def test_blockwise_equals_one_shot():
+	x = np.random.RandomState(0).standard_normal((2, 1000)) + 500
+	b, a = butter(3, [0.01, 0.3], btype='band')
+	for kind in (dict(b=b, a=a), dict(sos=butter_sos(5., 150., 1000.))):
+		whole = StreamingFilter(**kind)(x)
+		streaming = StreamingFilter(**kind)
+		out = np.concatenate([streaming(block) for block in blocks(x, [1, 0, 10, 333, 7])], axis=-1)
+		assert np.allclose(out, whole)
+
+
+def test_starts_in_steady_state():
+	sos = butter_sos(None, 40., 1000.)
+	y = StreamingFilter(sos=sos)(np.full(100, 512.))
+	assert np.allclose(y, 512.)
+
+
+def test_reset():
+	x = np.random.RandomState(1).standard_normal(300)
+	f = StreamingFilter(sos=signal_sos(1000.))
+	first = f(x)
+	f(x)
+	f.reset()
+	assert np.allclose(f(x), first)
+
+
+def test_filter_bank_alpha():
+	fs = 1000.
+	t = np.arange(int(4*fs))/fs
+	x = np.sin(2*np.pi*10*t) + 0.5*np.sin(2*np.pi*50*t)
+	bank = FilterBank(fs, shape=())
+	for block in blocks(x, [100]*39):
+		bank(block)
+	powers = bank.band_powers()
+	assert max(powers, key=powers.get) == 'alpha'
+	assert powers['alpha'] > 0.7
+
+
+def test_feed_filters_on_the_grid():
+	fs = 1000.
+	rng = np.random.RandomState(2)
+	t = np.cumsum(rng.uniform(0.5, 1.5, 3000))/fs
+	y = np.sin(2*np.pi*10*t)
+	sos = butter_sos(None, 40., fs)
+	feed = LiveDataFeed(5000, filter=StreamingFilter(sos=sos), resampler=StreamingResampler(fs))
+	for block in blocks(np.arange(len(t)), [250]*11):
+		feed.extend_data(dict(timestamp=t[block], temperature=y[block]))
+		feed.read_filtered()
+	tg, yg = feed.read_filtered()
+	assert np.allclose(np.diff(tg), 1./fs)
+	## the same as resampling first and filtering the uniform series
+	expected = StreamingFilter(sos=sos)(np.interp(tg, t, y))
+	assert np.allclose(yg, expected)
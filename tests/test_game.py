@@ -0,0 +1,73 @@
+import numpy as np
+
+from libs.game import BallGame
+
+
+def drives(n, seed=1):
+	return np.random.RandomState(seed).normal(0.01, 0.02, n)
+
+
+def test_seed_reproduces_game():
+	a = BallGame(2, seed=3)
+	b = BallGame(2, seed=3)
+	a.start()
+	b.start()
+	d = drives(500)
+	assert np.array_equal(a.run(d), b.run(d))
+	assert a.x == b.x and a.y == b.y and a.winner == b.winner
+
+
+def test_start_reseeds():
+	game = BallGame(2, seed=3)
+	game.start()
+	first = game.run(drives(500))
+	x, y = game.x.copy(), game.y.copy()
+	game.start(seed=3)
+	assert np.array_equal(game.run(drives(500)), first)
+	assert game.x == x and game.y == y
+
+
+def test_goal_ends_game():
+	game = BallGame(2, tuning_factor=1., noise=0.)
+	game.start()
+	steps = game.run(np.full(10, 0.3))
+	assert steps == 4
+	assert not game.playing
+	assert game.winner == 1
+	assert game.ball[0] == 1.
+
+
+def test_broadcast_matches_single_games():
+	factors = np.array([1., 5., 20.])
+	d = drives(300)
+	games = BallGame(2, tuning_factor=factors, seed=0)
+	games.start()
+	steps = games.run(d)
+	for i, factor in enumerate(factors):
+		game = BallGame(2, tuning_factor=factor, noise=0., seed=0)
+		game.start()
+		assert game.run(d) == steps[i]
+
+
+def test_advance_fixed_timestep():
+	game = BallGame(1, tuning_factor=1., dt=0.1, noise=0.)
+	game.start()
+	game.advance(10., 0.01)
+	game.advance(10.3)
+	assert game.nsteps == 3
+	assert np.isclose(game.x, 0.03)
+	game.advance(10.35, 0.1)
+	assert game.nsteps == 3
+	game.advance(10.4)
+	assert np.isclose(game.x, 0.13)
+
+
+def test_reset_during_play():
+	game = BallGame(1, tuning_factor=1., dt=0.1, noise=0.)
+	game.start()
+	game.advance(0., 0.01)
+	game.advance(0.5)
+	game.reset()
+	## the next advance only sets the time again
+	assert not game.advance(1.).any()
+	assert game.x == 0. and game.nsteps == 0
@@ -0,0 +1,97 @@
+import mmap, os
+import Queue
+import numpy as np
+
+from libs.recorder import SessionRecorder, read_index, magic, record_header
+from libs.replay import iter_chunks, ReplayThread
+
+chunks = [(b'\x81\x02\x03', 1.5), (b'', 1.6), (b'\x84' * 100, 2.25), (b'\x05\x86', 3.)]
+
+
+def record(path, chunks):
+	recorder = SessionRecorder(path, verbose=False)
+	recorder.start()
+	for data, timestamp in chunks:
+		recorder.write(data, timestamp)
+	recorder.join()
+	return recorder
+
+
+def test_file_format(tmpdir):
+	path = str(tmpdir.join('session.rec'))
+	recorder = record(path, chunks)
+	with open(path, 'rb') as f:
+		buf = f.read()
+	assert buf.startswith(magic)
+	assert len(buf) == len(magic) + len(chunks)*record_header.size + sum(len(data) for data, t in chunks)
+	assert recorder.nrecords == len(chunks) and not recorder.failed
+	timestamps, offsets, lengths = read_index(buf)
+	assert np.array_equal(timestamps, [t for data, t in chunks])
+	assert [buf[o:o+n] for o, n in zip(offsets, lengths)] == [data for data, t in chunks]
+
+
+def test_incomplete_record_ignored(tmpdir):
+	path = str(tmpdir.join('session.rec'))
+	record(path, chunks)
+	with open(path, 'rb') as f:
+		buf = f.read()
+	assert len(read_index(buf[:-1])[0]) == len(chunks) - 1
+
+
+def test_not_a_recording():
+	try:
+		read_index(b'RIFF' + b'\x00'*20)
+	except ValueError:
+		return
+	assert False
+
+
+def test_rechunked_replay(tmpdir):
+	path = str(tmpdir.join('session.rec'))
+	record(path, chunks)
+	with open(path, 'rb') as f:
+		buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		index = read_index(buf)
+		pieces = list(iter_chunks(buf, index, chunk_size=7))
+		buf.close()
+	assert b''.join(data for data, t in pieces) == b''.join(data for data, t in chunks)
+	assert all(len(data) == 7 for data, t in pieces[:-1])
+	assert [t for data, t in pieces][-1] == chunks[-1][1]
+
+
+def test_replay_round_trip(tmpdir):
+	path = str(tmpdir.join('session.rec'))
+	record(path, chunks)
+	data_q, error_q = Queue.Queue(), Queue.Queue()
+	replay = ReplayThread(data_q, error_q, path, realtime=False)
+	replay.start()
+	replay.finished.wait(5.)
+	replay.join()
+	replayed = []
+	while not data_q.empty():
+		replayed.append(data_q.get())
+	assert [(bytes(data), t) for data, t in replayed] == chunks
+	assert error_q.empty()
+
+
+def test_replay_missing_file_finishes(tmpdir):
+	data_q, error_q = Queue.Queue(), Queue.Queue()
+	path = str(tmpdir.join('missing.rec'))
+	replay = ReplayThread(data_q, error_q, path, realtime=False)
+	replay.start()
+	assert replay.finished.wait(5.)
+	replay.join()
+	assert path in error_q.get_nowait()
+	assert data_q.empty()
+
+
+def test_failed_recorder_drops_writes(tmpdir):
+	error_q = Queue.Queue()
+	path = os.path.join(str(tmpdir), 'missing', 'session.rec')
+	recorder = SessionRecorder(path, verbose=False, error_q=error_q)
+	recorder.start()
+	recorder.join(5.)
+	assert recorder.failed
+	assert path in error_q.get_nowait()
+	recorder.write(b'\x81', 1.)
+	assert recorder.queue.empty()
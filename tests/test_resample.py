@@ -0,0 +1,39 @@
+import numpy as np
+
+from libs.resample import StreamingResampler
+
+
+def test_grid_continues_across_calls():
+	fs = 1000.
+	rng = np.random.RandomState(0)
+	t = 5. + np.cumsum(rng.uniform(0.2, 3., 2000))/fs
+	v = np.sin(2*np.pi*3*t)
+	resampler = StreamingResampler(fs)
+	tg, vg = [], []
+	for start in range(0, len(t), 37):
+		a, b = resampler(t[start:start+37], v[start:start+37])
+		tg.append(a)
+		vg.append(b)
+	tg, vg = np.concatenate(tg), np.concatenate(vg)
+	## no gaps or repeats, the grid starts at the first sample
+	assert np.allclose(np.diff(tg), 1./fs)
+	assert tg[0] == t[0] and tg[-1] <= t[-1]
+	assert np.allclose(vg, np.interp(tg, t, v))
+
+
+def test_channels_share_timestamps():
+	resampler = StreamingResampler(10.)
+	t = np.array([0., 0.25, 0.3, 0.5])
+	v = np.array([[0., 1., 2., 3.], [0., -1., -2., -3.]])
+	tg, vg = resampler(t, v)
+	assert np.allclose(tg, [0., 0.1, 0.2, 0.3, 0.4, 0.5])
+	assert vg.shape == (2, 6)
+	assert np.allclose(vg[1], -vg[0])
+
+
+def test_overlapping_timestamps():
+	resampler = StreamingResampler(10.)
+	resampler([0., 0.5], [0., 5.])
+	tg, vg = resampler([0.45, 1.], [4.5, 10.])
+	assert np.allclose(tg, [0.6, 0.7, 0.8, 0.9, 1.])
+	assert np.all(np.diff(vg) >= 0)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
+
+
+def test_wraparound():
+	buf = RingBuffer(10)
+	x = np.arange(37.)
+	pos = 0
+	for n in (3, 7, 1, 9, 4, 13):
+		buf.extend(x[pos:pos+n])
+		pos += n
+		assert np.array_equal(buf.latest(), x[max(0, pos-10):pos])
+		assert buf.total == pos
+	assert np.array_equal(buf.latest(4), x[pos-4:pos])
+	assert np.array_equal(buf.latest(100), x[pos-10:pos])
+
+
+def test_append_matches_extend():
+	a, b = RingBuffer(5), RingBuffer(5)
+	for value in range(12):
+		a.append(value)
+	b.extend(np.arange(12))
+	assert np.array_equal(a.latest(), b.latest())
+	assert len(a) == len(b) == 5
+
+
+def test_channels_and_views():
+	buf = RingBuffer(8, (3,))
+	x = np.arange(3*20.).reshape(3, 20)
+	buf.extend(x[:, :6])
+	buf.extend(x[:, 6:15])
+	view = buf.latest(5)
+	assert view.shape == (3, 5)
+	assert np.array_equal(view, x[:, 10:15])
+	## a view, not a copy
+	assert np.shares_memory(view, buf.data)
+
+
+def test_clear():
+	buf = RingBuffer(4)
+	buf.extend(np.arange(6.))
+	buf.clear()
+	assert len(buf) == 0 and buf.total == 0 and buf.latest().shape == (0,)
+	buf.append(1.)
+	assert np.array_equal(buf.latest(), [1.])
@@ -0,0 +1,22 @@
+import numpy as np
+
+from libs.synthetic import SyntheticEEG
+from eeg_simulator import Simulator
+
+
+def test_synthetic_range():
+	samples = SyntheticEEG(1000, 2, seed=0).generate(10000)
+	## the 10 bit signal the monitors expect
+	assert abs(samples.mean() - 512) < 10
+	assert samples.min() > 300 and samples.max() < 1000
+
+
+def test_command_split_over_reads():
+	simulator = Simulator(1000, 1)
+	simulator.handle_commands(b'\x00conf s:5')
+	assert simulator.source.fs == 1000
+	simulator.handle_commands(b'00;c:2;conf s:2000;c:')
+	assert simulator.source.fs == 500 and simulator.source.nchannels == 2
+	simulator.handle_commands(b'1;')
+	assert simulator.source.fs == 2000 and simulator.source.nchannels == 1
+	assert simulator.commands == b''
@@ -0,0 +1,31 @@
+import warnings
+import numpy as np
+
+from libs.spectrum import SpectralEngine, RecursiveSpectrum
+
+
+def test_welch_band_powers():
+	fs = 1000.
+	t = np.arange(3000)/fs
+	x = np.vstack((np.sin(2*np.pi*10*t), np.sin(2*np.pi*20*t))) + 512
+	welch = SpectralEngine(fs, 1000, 900, nseg=1, shape=(2,))
+	welch.update(x)
+	powers = welch.band_powers()
+	assert powers['alpha'][0] > 0.9 and powers['beta'][1] > 0.9
+
+
+def flat_band_powers(engine):
+	with warnings.catch_warnings():
+		warnings.simplefilter('error')
+		engine.update(np.full((2, 3000), 512.))
+		return engine.band_powers()
+
+
+def test_flat_channel_has_no_band_power():
+	powers = flat_band_powers(SpectralEngine(1000., 1000, 900, nseg=1, shape=(2,)))
+	for values in powers.values():
+		assert np.array_equal(values, [0., 0.])
+	## rounding leaves some power after the highpass, but no NaN
+	powers = flat_band_powers(RecursiveSpectrum(1000., 1000, shape=(2,)))
+	for values in powers.values():
+		assert np.all(np.isfinite(values))